@@ -0,0 +1,136 @@
+import json
+import struct
+from os import listdir, path, makedirs
+
+
+class ImageInfo(object):
+	'''
+		Headless stand-in for a pygame Surface.
+		Only the size is known, it is read from the png header without decoding the image.
+	'''
+	def __init__(self, filename):
+		with open(filename, 'rb') as f:
+			header = f.read(24)
+
+		if header[:8] == b'\x89PNG\r\n\x1a\n':
+			self.size = struct.unpack('>II', header[16:24])
+		else:
+			import pygame
+			self.size = pygame.image.load(filename).get_size()
+
+	def get_size(self):
+		return self.size
+
+
+class Assets(object):
+	def __init__(self, root, headless = False, cache_dir = None):
+		'''
+			The images in root, one folder per category (potholes, cars, boosts, ...).
+			assets[category] is a dict {name: Surface}, a category is only loaded on first use.
+
+			headless: the dicts contain ImageInfo (only the sizes) instead of surfaces.
+			cache_dir: if set, each loaded category is packed into an atlas file there
+				(raw RGBA pixels), which is loaded instead of decoding the images next time.
+		'''
+		self.root = root
+		self.headless = headless
+		self.cache_dir = cache_dir
+
+		self.categories = {}
+		self.converted = False
+
+	def keys(self):
+		return [c for c in listdir(self.root) if path.isdir(path.join(self.root, c))]
+
+	def __contains__(self, category):
+		return category in self.keys()
+
+	def __getitem__(self, category):
+		images = self.categories.get(category)
+		if images is None:
+			images = self.categories[category] = self.load(category)
+		return images
+
+	def files(self, category):
+		'''Returns {name: filename} of all images in a category'''
+		folder = path.join(self.root, category)
+		return {f[:-4]: path.join(folder, f) for f in sorted(listdir(folder)) if f[-4:] in ('.png', '.jpg')}
+
+	def load(self, category):
+		files = self.files(category)
+		if self.headless:
+			return {name: ImageInfo(f) for name, f in files.items()}
+
+		import pygame
+
+		images = None
+		if self.cache_dir:
+			images = self.load_atlas(category, files)
+
+		if images is None:
+			images = {name: pygame.image.load(f) for name, f in files.items()}
+			if self.cache_dir:
+				self.save_atlas(category, files, images)
+
+		if self.converted:
+			images = {name: img.convert_alpha() for name, img in images.items()}
+
+		return images
+
+	def convert(self):
+		'''
+			Convert all (loaded and future) surfaces to the display format.
+			Has to be called after the display mode has been set.
+		'''
+		self.converted = True
+		for category, images in self.categories.items():
+			if not self.headless:
+				self.categories[category] = {name: img.convert_alpha() for name, img in images.items()}
+
+	## The atlas cache: a json index followed by all images as raw RGBA stacked vertically
+	def atlas_file(self, category):
+		return path.join(self.cache_dir, category + '.atlas')
+
+	def stamp(self, files):
+		'''Identifies the source files of an atlas'''
+		return [[name, path.getsize(f), path.getmtime(f)] for name, f in sorted(files.items())]
+
+	def save_atlas(self, category, files, images):
+		import pygame
+
+		width = max([img.get_width() for img in images.values()] + [1])
+		height = sum(img.get_height() for img in images.values())
+		atlas = pygame.Surface((width, max(height, 1)), pygame.SRCALPHA, 32)
+
+		index = {'stamp': self.stamp(files), 'size': [width, max(height, 1)], 'images': {}}
+		y = 0
+		for name, img in sorted(images.items()):
+			atlas.blit(img, (0, y))
+			index['images'][name] = [0, y, img.get_width(), img.get_height()]
+			y += img.get_height()
+
+		header = json.dumps(index).encode('utf-8')
+		if not path.isdir(self.cache_dir):
+			makedirs(self.cache_dir)
+		with open(self.atlas_file(category), 'wb') as f:
+			f.write(struct.pack('<I', len(header)))
+			f.write(header)
+			f.write(pygame.image.tostring(atlas, 'RGBA'))
+
+	def load_atlas(self, category, files):
+		'''Returns the images from the atlas or None if there is no up to date atlas'''
+		import pygame
+
+		filename = self.atlas_file(category)
+		if not path.isfile(filename):
+			return None
+
+		with open(filename, 'rb') as f:
+			length = struct.unpack('<I', f.read(4))[0]
+			index = json.loads(f.read(length).decode('utf-8'))
+			if index['stamp'] != json.loads(json.dumps(self.stamp(files))):
+				return None
+			pixels = f.read()
+
+		atlas = pygame.image.fromstring(pixels, tuple(index['size']), 'RGBA')
+		return {name: atlas.subsurface(pygame.Rect(rect)) for name, rect in index['images'].items()}
@@ -0,0 +1,223 @@
+import math
+import random
+import numpy as np
+
+from engine import LEFT, RIGHT, PUMP, BRAKE
+from geometry import Point
+
+# Board parameters, see SlalomBoard
+PARAMETERS = ('max_lean', 'lean_vel', 'max_speed', 'jitter', 'break_speed', 'slowed',
+	'break_effect', 'max_pump', 'optimal_velocity', 'sigma')
+
+
+class BoardBatch(object):
+	def __init__(self, boards, start, direction = Point(0, 5), rng = None):
+		'''
+			N SlalomBoards advanced together (struct of arrays).
+
+			boards is a list of board parameter dicts (like the 'board' dict of the game parameters),
+			all boards share the start position and the initial direction.
+			rng needs a uniform(low, high) method returning an array (default: numpy default_rng).
+		'''
+		self.n = len(boards)
+		self.rng = rng if rng is not None else np.random.default_rng()
+
+		for p in PARAMETERS:
+			setattr(self, p, np.array([float(b[p]) for b in boards]))
+
+		self.pump_scale = 1 / np.sqrt(2 * math.pi * self.sigma ** 2)
+
+		# The state
+		self.start = start.copy()
+		self.x = np.full(self.n, self.start.x)
+		self.y = np.full(self.n, self.start.y)
+		self.dx = np.full(self.n, float(direction.x))
+		self.dy = np.full(self.n, float(direction.y))
+		self.player = np.zeros(self.n)
+		self.pump_blocked = np.zeros(self.n, dtype = bool)
+
+	def _mask(self, mask):
+		if mask is None:
+			return np.ones(self.n, dtype = bool)
+		return np.asarray(mask, dtype = bool)
+
+	def board_vector(self):
+		'''Returns the vect of every board vector as (x, y) arrays'''
+		# Same operations as Vector(pos, pos.transform(direction)).vect
+		sy = self.start.y
+		return (self.x + self.dx) - self.x, (sy + self.dy) - sy
+
+	def player_vector(self):
+		'''Returns the vect of every player vector as (x, y) arrays'''
+		sy = self.start.y
+		bx, by = self.board_vector()
+
+		# scale_absolute(10)
+		scale = 10 / np.sqrt(bx ** 2 + by ** 2)
+		sx = (self.x + scale * bx) - self.x
+		sv = (sy + scale * by) - sy
+
+		# normal_vector(-player)
+		px = ((-sv) * (-self.player) + self.x) - self.x
+		py = (sx * (-self.player) + sy) - sy
+		return px, py
+
+	def speed(self):
+		bx, by = self.board_vector()
+		return np.sqrt(bx ** 2 + by ** 2)
+
+	def break_board(self, mask = None):
+		mask = self._mask(mask)
+		sy = self.start.y
+		bx, by = self.board_vector()
+		length = np.sqrt(bx ** 2 + by ** 2)
+		moving = length > 0
+		ratio = np.where(moving, (length - self.slowed) / np.where(moving, length, 1.0), 1.0)
+
+		dx = (self.x + ratio * bx) - self.x
+		dy = (sy + ratio * by) - sy
+		self.dx = np.where(mask, dx, self.dx)
+		self.dy = np.where(mask, dy, self.dy)
+
+	def lean(self, mask = None, left = True):
+		mask = self._mask(mask)
+		l = self.lean_vel
+		if left:
+			inside = self.player - l >= -self.max_lean
+			unblock = mask & inside & (self.player > 0) & (l > self.player)
+			player = np.where(inside, self.player - l, -self.max_lean)
+		else:
+			inside = self.player + l <= self.max_lean
+			unblock = mask & inside & (self.player < 0) & (l > np.abs(self.player))
+			player = np.where(inside, self.player + l, self.max_lean)
+
+		self.pump_blocked &= ~unblock
+		self.player = np.where(mask, player, self.player)
+
+	def pump_efficiency(self):
+		velocity = np.sqrt(self.dx ** 2 + self.dy ** 2)
+		leaning = np.abs(self.player) / self.max_lean
+
+		expo = (velocity - self.optimal_velocity) ** 2 / (2 * self.sigma ** 2)
+		speed = 1 / np.sqrt(2 * math.pi * self.sigma ** 2)
+		speed *= np.exp(-expo)
+		speed /= self.pump_scale
+
+		return leaning * speed
+
+	def pump(self, mask = None):
+		mask = self._mask(mask) & ~self.pump_blocked
+		self.pump_blocked |= mask
+
+		velocity = np.sqrt(self.dx ** 2 + self.dy ** 2)
+		pump = self.pump_efficiency() * self.max_pump
+		# Boards standing still have no direction to pump along
+		moving = velocity > 0
+		ratio = np.where(moving, (velocity + pump) / np.where(moving, velocity, 1.0), 1.0)
+
+		self.dx = np.where(mask, ratio * self.dx, self.dx)
+		self.dy = np.where(mask, ratio * self.dy, self.dy)
+
+	def apply_input(self, flags):
+		'''
+			Apply an array of input flags (engine.LEFT, RIGHT, PUMP, BRAKE),
+			in the same order as Game.apply_input.
+		'''
+		flags = np.asarray(flags)
+		self.pump(flags & PUMP)
+		self.lean(flags & LEFT, True)
+		self.lean(flags & RIGHT, False)
+		self.break_board(flags & BRAKE)
+
+	def on_tick(self):
+		bx, by = self.board_vector()
+		px, py = self.player_vector()
+		nx = bx + px
+		ny = by + py
+
+		#You can not go backwards
+		ny = np.where(ny < 0, 0.0, ny)
+
+		# Slow down if above break speed
+		length = np.sqrt(nx ** 2 + ny ** 2)
+		slow = length > self.break_speed
+		ratio = np.where(slow, (length - self.slowed) / length, 1.0)
+		nx = np.where(slow, ratio * nx, nx)
+		ny = np.where(slow, ratio * ny, ny)
+
+		# Jitter the player if above max speed
+		fast = np.flatnonzero(length > self.max_speed)
+		if len(fast):
+			change = self.rng.uniform(-self.jitter[fast], self.jitter[fast])
+			player = self.player[fast] + change
+			ok = np.abs(player) < self.max_lean[fast]
+			self.player[fast[ok]] = player[ok]
+
+		self.x = self.x + nx
+		self.y = self.y + ny
+		self.dx = nx
+		self.dy = ny
+
+
+class _PythonUniform(object):
+	'''Draws jitter like the random module, in the order the scalar boards would.'''
+	def __init__(self, seed):
+		self.random = random.Random(seed)
+
+	def uniform(self, low, high):
+		return np.array([self.random.uniform(l, h) for l, h in zip(low, high)])
+
+
+def compare(n = 50, ticks = 2000, seed = 1, max_speed = (10, 30), choices = None):
+	'''
+		Runs n random boards as SlalomBoards and as a BoardBatch with the same random inputs.
+		Returns the maximum absolute difference in position, direction and lean.
+		max_speed is the range of the board max_speed, the input flags are chosen from choices.
+	'''
+	from engine import SlalomBoard
+	if choices is None:
+		choices = (0, LEFT, RIGHT, PUMP, LEFT | PUMP, RIGHT | PUMP, BRAKE)
+
+	gen = random.Random(seed)
+	boards = []
+	for i in range(n):
+		boards.append({
+			'max_lean': gen.uniform(0.01, 0.04), 'lean_vel': gen.uniform(0.0005, 0.003),
+			'max_speed': gen.uniform(*max_speed), 'jitter': gen.uniform(0, 0.03), 'break_speed': 1,
+			'slowed': gen.uniform(0.01, 0.1), 'break_effect': 1.5, 'max_pump': gen.uniform(1, 8),
+			'optimal_velocity': gen.uniform(5, 20), 'sigma': gen.uniform(5, 20)
+			})
+
+	start = Point(375, 81.25)
+	scalar = [SlalomBoard(start = start, direction = Point(0, 5), **b) for b in boards]
+	batch = BoardBatch(boards, start, Point(0, 5), _PythonUniform(seed))
+
+	inputs = np.array([[gen.choice(choices) for i in range(n)] for t in range(ticks)])
+
+	random.seed(seed)
+	for t in range(ticks):
+		for b, flags in zip(scalar, inputs[t]):
+			if flags & PUMP:
+				b.pump()
+			if flags & LEFT:
+				b.lean(True)
+			if flags & RIGHT:
+				b.lean(False)
+			if flags & BRAKE:
+				b.break_board()
+		batch.apply_input(inputs[t])
+
+		for b in scalar:
+			b.on_tick()
+		batch.on_tick()
+
+	diff = 0
+	for i, b in enumerate(scalar):
+		state = (b.position.x - batch.x[i], b.position.y - batch.y[i], b.direction.x - batch.dx[i],
+			b.direction.y - batch.dy[i], b.player - batch.player[i])
+		diff = max([diff] + [abs(s) for s in state])
+	return diff
+
+
+if __name__ == '__main__':
+	print('Maximum difference to SlalomBoard: {}'.format(compare()))
@@ -0,0 +1,246 @@
+'''
+	Benchmarks for SlalomBoard.
+
+	Levels:
+		micro:  geometry.Vector operations
+		tick:   SlalomBoard.on_tick and Game.on_tick at low, medium, high and crowded obstacle density,
+		        with the grid and the array obstacle store, and what they allocate: the bytes
+		        allocated during a call (tracemalloc peak) and the gc collections per 1000 calls
+		render: full frames (snapshot, draw and tick) on an off-screen surface
+
+	python benchmark.py [--levels micro tick render] [--output results.json]
+	python benchmark.py --compare old.json new.json [--threshold 0.1]
+'''
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+from copy import deepcopy
+
+import engine
+from geometry import Point, Vector
+
+
+def densities():
+	'''
+		Game parameters at low, medium and high obstacle density,
+		from the two map elements of engine.example_parameters,
+		and crowded (hundreds of obstacles at once).
+	'''
+	elements = engine.example_parameters['elements']
+	levels = {'low': elements[0], 'medium': elements[10000],
+		'high': deepcopy(elements[10000]), 'crowded': deepcopy(elements[10000])}
+
+	for params in levels['high'].values():
+		if isinstance(params, dict):
+			params['probability'] = min(1.0, params['probability'] * 4)
+
+	levels['crowded']['step_size'] = 8
+	for name in ('obstacles', 'boosts'):
+		levels['crowded'][name]['probability'] = 1.0
+
+	games = {}
+	for name, element in levels.items():
+		params = deepcopy(engine.example_parameters)
+		params['elements'] = {0: deepcopy(element)}
+		games[name] = params
+	return games
+
+
+def measure(fn, number, repeat = 5):
+	'''Returns the timings of fn in seconds per call'''
+	times = [t / number for t in timeit.repeat(fn, number = number, repeat = repeat)]
+	times.sort()
+	return {'min': times[0], 'median': times[len(times) // 2], 'number': number, 'repeat': repeat}
+
+
+def measure_allocations(fn, number):
+	'''
+		Returns the mean bytes fn allocates during a call (the tracemalloc peak above the memory
+		in use before it, so temporaries count even when they are freed again) and the gc
+		collections per 1000 calls (run without tracemalloc)
+	'''
+	fn()
+	gc.collect()
+	before = sum(s['collections'] for s in gc.get_stats())
+	for _ in range(number):
+		fn()
+	collections = sum(s['collections'] for s in gc.get_stats()) - before
+
+	tracemalloc.start()
+	allocated = 0
+	for _ in range(number):
+		tracemalloc.reset_peak()
+		current = tracemalloc.get_traced_memory()[0]
+		fn()
+		allocated += tracemalloc.get_traced_memory()[1] - current
+	tracemalloc.stop()
+	return {'alloc_bytes': float(allocated) / number, 'collections': collections * 1000.0 / number}
+
+
+def warm_game(parameters, ticks = 600, seed = 1):
+	'''A headless game after some ticks, so the obstacles have spawned'''
+	game, _ = engine.simulate(parameters, engine.weave_policy, ticks, seed = seed)
+	return game
+
+
+def game_ticker(game):
+	def tick():
+		game.apply_input(engine.weave_policy(game))
+		game.on_tick()
+	return tick
+
+
+def bench_micro():
+	v = Vector(Point(10, 20), Point(200, 300))
+	w = Vector(Point(0, 300), Point(300, 0))
+	center = Point(120, 160)
+	outside = Point(-50, 400)
+
+	return {
+		'vector.intersect': measure(lambda: v.intersect(w), 20000),
+		'vector.circle_collision': measure(lambda: v.circle_collision(center, 30), 20000),
+		'vector.closest_point': measure(lambda: v.closest_point(outside), 20000),
+		'vector.distance_sq': measure(lambda: v.distance_sq(outside), 20000),
+		'vector.rect_collision': measure(lambda: v.rect_collision(center, 30, 20), 20000),
+		'vector.scale_absolute': measure(lambda: v.scale_absolute(20), 20000),
+		'vector.scale_absolute_inplace': measure(lambda: v.scale_absolute_inplace(20), 20000),
+		'vector.length': measure(v.length, 50000),
+		}
+
+
+def bench_tick():
+	results = {}
+
+	board = warm_game(engine.example_parameters, 200).board
+	def board_tick():
+		board.lean(board.player < 0)
+		board.pump()
+		board.on_tick()
+		if board.speed() < 3:
+			board.direction.set(0.0, 8.0)
+	results['board.on_tick'] = measure(board_tick, 20000)
+	results['board.on_tick'].update(measure_allocations(board_tick, 5000))
+
+	for name, parameters in sorted(densities().items()):
+		for suffix, store in (('', 'grid'), ('.array', 'array')):
+			store_parameters = deepcopy(parameters)
+			store_parameters['general']['obstacle_store'] = store
+			result = results['game.on_tick.' + name + suffix] = measure(game_ticker(warm_game(store_parameters)), 1000)
+			# On a new game, the timings ran the first one for 5000 ticks
+			result.update(measure_allocations(game_ticker(warm_game(store_parameters)), 1000))
+
+	return results
+
+
+def bench_render():
+	if not os.environ.get('DISPLAY'):
+		os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+	import pygame
+	from render import Renderer
+	from pipeline import take
+
+	pygame.init()
+	# A display has to exist for the surface conversions
+	pygame.display.set_mode((1, 1))
+	engine.bmps.convert()
+
+	results = {}
+	for name, parameters in sorted(densities().items()):
+		general = engine.setup_parameters(parameters)['general']
+		# .full redraws the whole street every frame
+		for suffix, dirty_rects in (('', True), ('.full', False)):
+			game = warm_game(parameters)
+			surface = pygame.Surface(general['size'])
+			renderer = Renderer(surface, dict(general, dirty_rects = dirty_rects), engine.bmps)
+
+			tick = game_ticker(game)
+			def frame():
+				renderer.draw(take(game), 40)
+				tick()
+			results['render.frame.' + name + suffix] = measure(frame, 200)
+
+	pygame.quit()
+	return results
+
+
+LEVELS = {'micro': bench_micro, 'tick': bench_tick, 'render': bench_render}
+
+
+def run(levels):
+	results = {}
+	for level in levels:
+		results.update(LEVELS[level]())
+
+	meta = {'python': platform.python_version(), 'platform': platform.platform(),
+		'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'levels': list(levels)}
+	return {'meta': meta, 'results': results}
+
+
+# The compared metrics of a result: (key, unit, scale of the printed value, smallest base of a change)
+METRICS = (('min', 'us', 1e6, 0.0), ('alloc_bytes', 'B', 1, 16.0), ('collections', 'gc', 1, 1.0))
+
+
+def compare(old, new, threshold = 0.1):
+	'''
+		Compares the min timings, the bytes allocated per call and the gc collections per
+		1000 calls of two runs, returns a list of (name, unit, old, new, ratio, flag) with
+		flag 'REGRESSION', 'faster' or ''. The allocations are often 0, their changes are
+		relative to at least 16 bytes and 1 collection.
+	'''
+	rows = []
+	for name in sorted(set(old['results']) & set(new['results'])):
+		for key, unit, scale, base in METRICS:
+			if key not in old['results'][name] or key not in new['results'][name]:
+				continue
+			a = old['results'][name][key]
+			b = new['results'][name][key]
+			ratio = (b - a) / max(abs(a), base) + 1
+			if ratio > 1 + threshold:
+				flag = 'REGRESSION'
+			elif ratio < 1 - threshold:
+				flag = 'faster'
+			else:
+				flag = ''
+			rows.append((name, unit, a * scale, b * scale, ratio, flag))
+	return rows
+
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = 'SlalomBoard benchmarks')
+	parser.add_argument('--levels', nargs = '+', choices = sorted(LEVELS), default = ['micro', 'tick', 'render'])
+	parser.add_argument('--output', '-o', help = 'write the results to this json file')
+	parser.add_argument('--compare', nargs = 2, metavar = ('OLD', 'NEW'), help = 'compare two result files')
+	parser.add_argument('--threshold', type = float, default = 0.1, help = 'relative change flagged by --compare')
+	args = parser.parse_args(argv)
+
+	if args.compare:
+		with open(args.compare[0]) as f:
+			old = json.load(f)
+		with open(args.compare[1]) as f:
+			new = json.load(f)
+
+		rows = compare(old, new, args.threshold)
+		for name, unit, a, b, ratio, flag in rows:
+			print('{:<34} {:>12.2f}{:<3} {:>12.2f}{:<3} {:>7.2f}x  {}'.format(name, a, unit, b, unit, ratio, flag))
+		return 1 if any(r[5] == 'REGRESSION' for r in rows) else 0
+
+	results = run(args.levels)
+	for name, r in sorted(results['results'].items()):
+		allocations = ' {:>10.1f}B {:>7.1f}gc'.format(r['alloc_bytes'], r['collections']) if 'alloc_bytes' in r else ''
+		print('{:<34} {:>12.2f}us{}'.format(name, r['min'] * 1e6, allocations))
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent = 2, sort_keys = True)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,35 @@
+'''
+	Game clocks for the checkpoint timing.
+
+	A Game calls tick() once per tick and now() for the game time in seconds.
+	TickClock runs on ticks (headless games, replays, training), so the outcome does not
+	depend on how fast the game is simulated. RealClock runs on monotonic wall time
+	(interactive play).
+'''
+import time
+
+
+class TickClock(object):
+	def __init__(self, tick_rate = 40):
+		'''Game time is ticks / tick_rate'''
+		self.tick_rate = float(tick_rate)
+		self.ticks = 0
+
+	def tick(self):
+		self.ticks += 1
+
+	def now(self):
+		return self.ticks / self.tick_rate
+
+
+class RealClock(object):
+	def __init__(self, source = time.monotonic):
+		'''Game time is the time since the clock was created (source returns seconds)'''
+		self.source = source
+		self.start = source()
+
+	def tick(self):
+		pass
+
+	def now(self):
+		return self.source() - self.start
@@ -0,0 +1,315 @@
+'''
+	Garage configurations (boards, endless elements, maps and the general parameters).
+
+	Formats:
+		.json  versioned json for editing: {"version": 1, "configuration": {...}}
+		.slc   compiled binary: an index of all items followed by one json blob per item,
+		       so a single board or map is loaded without parsing the rest (load_item)
+		.conf  the old pickles of the garage, only read (through a restricted unpickler)
+
+	python config.py check FILE
+	python config.py convert OLD NEW   (e.g. old.conf new.json or new.json new.slc)
+'''
+import json
+import pickle
+import struct
+import sys
+
+
+VERSION = 1
+MAGIC = b'SLCF'
+
+SECTIONS = ('boards', 'endless', 'semi_random')
+
+# The keys SlalomBoard.__init__, Game.set_parameters and Game.__init__ require
+BOARD_KEYS = ('max_lean', 'lean_vel', 'max_speed', 'jitter', 'break_speed', 'slowed',
+	'break_effect', 'max_pump', 'optimal_velocity', 'sigma')
+ELEMENT_KEYS = {
+	'step_size': None,
+	'message': None,
+	'obstacles': ('probability', 'size', 'speed'),
+	'boosts': ('probability', 'size', 'speed'),
+	'forward_cars': ('probability', 'size', 'moving'),
+	'backwards_cars': ('probability', 'size', 'moving'),
+	}
+GENERAL_KEYS = ('size', 'start_pos', 'border_size', 'dist_checkpoint', 'time_checkpoint', 'delta_time', 'delta_dist')
+
+
+class ConfigError(ValueError):
+	pass
+
+
+## Validation
+def is_number(value):
+	return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_keys(d, keys, where, errors):
+	if not isinstance(d, dict):
+		errors.append('{}: not a dict'.format(where))
+		return False
+	for key in keys:
+		if key not in d:
+			errors.append('{}: missing {}'.format(where, key))
+	return True
+
+
+def check_pair(value, where, errors):
+	if not (isinstance(value, (list, tuple)) and len(value) == 2 and all(is_number(v) for v in value)):
+		errors.append('{}: not a pair of numbers'.format(where))
+
+
+def validate_board(board, where = 'board', errors = None):
+	errors = [] if errors is None else errors
+	if check_keys(board, BOARD_KEYS, where, errors):
+		for key in BOARD_KEYS:
+			if key in board and not is_number(board[key]):
+				errors.append('{}.{}: not a number'.format(where, key))
+	return errors
+
+
+def validate_element(element, where = 'element', errors = None):
+	errors = [] if errors is None else errors
+	if not check_keys(element, ELEMENT_KEYS, where, errors):
+		return errors
+
+	if 'step_size' in element and not is_number(element['step_size']):
+		errors.append('{}.step_size: not a number'.format(where))
+
+	for key, keys in ELEMENT_KEYS.items():
+		if keys is None or key not in element:
+			continue
+		sub = '{}.{}'.format(where, key)
+		if check_keys(element[key], keys, sub, errors):
+			for k in keys:
+				if k == 'probability':
+					if k in element[key] and not is_number(element[key][k]):
+						errors.append('{}.probability: not a number'.format(sub))
+				elif k in element[key]:
+					check_pair(element[key][k], '{}.{}'.format(sub, k), errors)
+	return errors
+
+
+def validate_general(general, where = 'general', errors = None):
+	errors = [] if errors is None else errors
+	if check_keys(general, GENERAL_KEYS, where, errors) and 'size' in general:
+		check_pair(general['size'], where + '.size', errors)
+	return errors
+
+
+def validate_map(game_map, where = 'map', errors = None):
+	'''A map has its own general parameters and the elements {distance: element}'''
+	errors = [] if errors is None else errors
+	if not check_keys(game_map, ('general', 'elements'), where, errors):
+		return errors
+
+	if 'general' in game_map:
+		validate_general(game_map['general'], where + '.general', errors)
+	for distance, element in game_map.get('elements', {}).items():
+		if not isinstance(distance, int):
+			errors.append('{}.elements: distance {!r} is not an int'.format(where, distance))
+		validate_element(element, '{}.elements.{}'.format(where, distance), errors)
+	return errors
+
+
+def validate(configuration):
+	'''Raises ConfigError listing all problems of a configuration'''
+	errors = []
+	if not check_keys(configuration, SECTIONS + ('general',), 'configuration', errors):
+		raise ConfigError('\n'.join(errors))
+
+	validate_general(configuration.get('general', {}), 'general', errors)
+	for name, board in configuration.get('boards', {}).items():
+		validate_board(board, 'boards.' + name, errors)
+	for name, element in configuration.get('endless', {}).items():
+		validate_element(element, 'endless.' + name, errors)
+	for name, game_map in configuration.get('semi_random', {}).items():
+		validate_map(game_map, 'semi_random.' + name, errors)
+
+	if errors:
+		raise ConfigError('\n'.join(errors))
+	return configuration
+
+
+## Conversion from json (only str keys, lists instead of tuples)
+def tuples(value):
+	'''The garage edits pairs as tuples, json only has lists'''
+	if isinstance(value, dict):
+		return {k: tuples(v) for k, v in value.items()}
+	if isinstance(value, list):
+		return tuple(tuples(v) for v in value)
+	return value
+
+
+def item_from_json(section, item):
+	item = tuples(item)
+	if section == 'semi_random':
+		item['elements'] = {int(k): v for k, v in item['elements'].items()}
+	return item
+
+
+def from_json(data):
+	if not isinstance(data, dict) or 'version' not in data:
+		raise ConfigError('not a versioned configuration')
+	if data['version'] > VERSION:
+		raise ConfigError('configuration version {} is newer than {}'.format(data['version'], VERSION))
+
+	configuration = data['configuration']
+	for section in SECTIONS:
+		items = configuration.get(section, {})
+		configuration[section] = {name: item_from_json(section, item) for name, item in items.items()}
+	configuration['general'] = tuples(configuration.get('general', {}))
+	return configuration
+
+
+def dumps(value):
+	return json.dumps(value, sort_keys = True).encode('utf-8')
+
+
+## The old pickles
+class RestrictedUnpickler(pickle.Unpickler):
+	'''Only plain data (dicts, lists, tuples, strings and numbers), no classes or functions'''
+	def find_class(self, module, name):
+		raise ConfigError('forbidden object in configuration pickle: {}.{}'.format(module, name))
+
+
+def load_pickle(filename):
+	with open(filename, 'rb') as f:
+		# The garage wrote them with Python 2 (protocol 0, str as bytes)
+		return RestrictedUnpickler(f, encoding = 'latin1').load()
+
+
+## The compiled binary: MAGIC, version, index length, json index {section: {name: [offset, length]}}
+def save_binary(configuration, filename):
+	blobs = []
+	offset = [0]
+
+	def add(item):
+		blob = dumps(item)
+		blobs.append(blob)
+		offset[0] += len(blob)
+		return [offset[0] - len(blob), len(blob)]
+
+	index = {'general': add(configuration['general'])}
+	for section in SECTIONS:
+		index[section] = {name: add(item) for name, item in sorted(configuration[section].items())}
+
+	header = dumps(index)
+	with open(filename, 'wb') as f:
+		f.write(MAGIC)
+		f.write(struct.pack('<HI', VERSION, len(header)))
+		f.write(header)
+		for blob in blobs:
+			f.write(blob)
+
+
+def read_index(f):
+	if f.read(4) != MAGIC:
+		raise ConfigError('not a compiled configuration')
+	version, length = struct.unpack('<HI', f.read(6))
+	if version > VERSION:
+		raise ConfigError('configuration version {} is newer than {}'.format(version, VERSION))
+	index = json.loads(f.read(length).decode('utf-8'))
+	return index, f.tell()
+
+
+def read_blob(f, start, entry):
+	f.seek(start + entry[0])
+	return json.loads(f.read(entry[1]).decode('utf-8'))
+
+
+def load_binary(filename):
+	with open(filename, 'rb') as f:
+		index, start = read_index(f)
+		configuration = {'general': tuples(read_blob(f, start, index['general']))}
+		for section in SECTIONS:
+			configuration[section] = {name: item_from_json(section, read_blob(f, start, entry))
+				for name, entry in index.get(section, {}).items()}
+	return configuration
+
+
+def load_item(filename, section, name):
+	'''
+		Loads one item (a board, endless element or map) by name.
+		Compiled files only read the index and the item, other formats are loaded completely.
+	'''
+	if section not in SECTIONS:
+		raise ConfigError('unknown section {}'.format(section))
+
+	if not is_binary(filename):
+		return load(filename)[section][name]
+
+	with open(filename, 'rb') as f:
+		index, start = read_index(f)
+		entry = index.get(section, {}).get(name)
+		if entry is None:
+			raise KeyError('{} has no {} {}'.format(filename, section, name))
+		item = item_from_json(section, read_blob(f, start, entry))
+
+	errors = []
+	{'boards': validate_board, 'endless': validate_element, 'semi_random': validate_map}[section](item, name, errors)
+	if errors:
+		raise ConfigError('\n'.join(errors))
+	return item
+
+
+def names(filename, section):
+	'''The names of the items in a section'''
+	if is_binary(filename):
+		with open(filename, 'rb') as f:
+			return sorted(read_index(f)[0].get(section, {}))
+	return sorted(load(filename)[section])
+
+
+## Loading and saving any format
+def is_binary(filename):
+	with open(filename, 'rb') as f:
+		return f.read(4) == MAGIC
+
+
+def load(filename):
+	'''Loads and validates a configuration (json, compiled or an old pickle)'''
+	with open(filename, 'rb') as f:
+		start = f.read(4)
+
+	if start == MAGIC:
+		configuration = load_binary(filename)
+	elif start.lstrip()[:1] == b'{':
+		with open(filename) as f:
+			configuration = from_json(json.load(f))
+	else:
+		configuration = load_pickle(filename)
+
+	return validate(configuration)
+
+
+def save(configuration, filename):
+	'''Validates and saves a configuration, compiled if filename ends with .slc, json otherwise'''
+	validate(configuration)
+	if filename.endswith('.slc'):
+		save_binary(configuration, filename)
+	else:
+		with open(filename, 'w') as f:
+			json.dump({'version': VERSION, 'configuration': configuration}, f, indent = 1, sort_keys = True)
+
+
+def main(argv = None):
+	argv = sys.argv[1:] if argv is None else argv
+	if len(argv) == 2 and argv[0] == 'check':
+		configuration = load(argv[1])
+		for section in SECTIONS:
+			print('{}: {}'.format(section, ', '.join(sorted(configuration[section]))))
+	elif len(argv) == 3 and argv[0] == 'convert':
+		save(load(argv[1]), argv[2])
+	else:
+		print(__doc__)
+		return 1
+	return 0
+
+
+if __name__ == '__main__':
+	try:
+		sys.exit(main())
+	except ConfigError as e:
+		print('Invalid configuration:\n' + str(e))
+		sys.exit(1)
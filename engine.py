@@ -1,24 +1,36 @@
+import base64
+import json
 import math
-import pygame
 import random
 import time
-from os import listdir
-from pygame.locals import QUIT, KEYDOWN, K_LEFT, K_RIGHT, K_SPACE, K_DOWN
+import zlib
+from collections import deque
+from copy import deepcopy
+from itertools import count
+from os import path
 from geometry import Point, Vector
+from spatial import ObstacleGrid
+from timeline import MapTimeline, TimelineCursor
+from spawn import SpawnStream
+from clock import TickClock
+from assets import Assets
+from profiler import NullProfiler
 
-# Intialize pygame
-pygame.init()
+IMG_PATH = path.join(path.dirname(path.abspath(__file__)), 'img')
 
-# All the images
-bmps = {'potholes': {}, 'boards': {}, 'player': {}, 'signs': {}, 'cars': {}, 'boosts': {}}
+# All the images, loaded per category on first use
+bmps = Assets(IMG_PATH)
+# Only the image sizes (for headless games)
+headers = Assets(IMG_PATH, headless = True)
 
-for folder in bmps.keys():
-	path = 'img/' + folder + '/' 
-	files = [path + f for f in listdir(path)]
-	for f in listdir(path):
-		if f[-4:] in ('.png', '.jpg'):
-			p = path + f
-			bmps[folder][f[:-4] ] = pygame.image.load(p)
+# Input flags for a single tick (see Game.apply_input)
+LEFT, RIGHT, PUMP, BRAKE = 1, 2, 4, 8
+
+# Ticks per second of the game (all board and obstacle movements are per tick)
+TICK_RATE = 40
+
+# Numbers every added obstacle (unique over all games), the renderer keeps its sprite by it
+SERIALS = count()
 
 
 class SlalomBoard(object):
@@ -26,7 +38,7 @@ class SlalomBoard(object):
 
 		self.start = parameters['start'].copy()
 		self.position = self.start.copy()
-		self.direction = parameters['direction']
+		self.direction = parameters['direction'].copy()
 		self.player = 0.0
 
 		# Board Parameters: Leaning
@@ -53,21 +65,52 @@ class SlalomBoard(object):
 		self.pump_blocked = False
 		self.currently_on = False
 
+		# Random source for the jitter (random.Random instance, default: the random module)
+		self.random = parameters.get('random') or random
+
+		# Reused by the *_view methods and on_tick
+		self._board = Vector(self.start, self.start)
+		self._player = Vector(self.start, self.start)
+		self._velocity = Vector(self.start, self.start)
+
 	def board_vector(self):
 		pos = Point(self.position.x, self.start.y)
 		board = Vector(pos, pos.transform(self.direction))
 		return board
 
+	def board_vector_view(self):
+		'''
+			Same as board_vector, but the returned vector is reused by the next call.
+		'''
+		x = self.position.x
+		y = self.start.y
+		return self._board.set(x, y, x + self.direction.x, y + self.direction.y)
+
 	def player_vector(self):
 		scaled =  self.board_vector().scale_absolute(10)
 		return scaled.normal_vector(-self.player)
 
+	def player_vector_view(self):
+		'''
+			Same as player_vector, but the returned vector is reused by the next call.
+		'''
+		board = self.board_vector_view()
+		scaled = self._player.set(board.p1.x, board.p1.y, board.p2.x, board.p2.y).scale_absolute_inplace(10)
+		return scaled.normal_vector_inplace(-self.player)
+
+	def velocity_vector_view(self):
+		'''
+			The direction as a vector starting at (0, 0), reused by the next call.
+		'''
+		return self._velocity.set(0.0, 0.0, self.direction.x, self.direction.y)
+
 	def speed(self):
-		return self.board_vector().length()
+		return self.board_vector_view().length()
 
 	def break_board(self):
 		scale = self.speed() - self.slowed
-		self.direction = self.board_vector().scale_absolute(scale).vect
+		vect = self.board_vector_view().scale_absolute_inplace(scale).vect
+		self.direction.set(vect.x, vect.y)
 
 	def lean(self, left = True):
 		l = self.lean_vel
@@ -87,8 +130,7 @@ class SlalomBoard(object):
 				self.player = self.max_lean
 
 	def pump_efficiency(self):
-		dir_vect = Vector(Point(0,0), self.direction)
-		velocity = dir_vect.length()
+		velocity = self.velocity_vector_view().length()
 
 		# Scale pumping (best pumping in curve at optimal pumping speed)
 
@@ -115,44 +157,44 @@ class SlalomBoard(object):
 		if not self.pump_blocked:
 			self.pump_blocked = True
 
-			dir_vect = Vector(Point(0,0), self.direction)
-			velocity = dir_vect.length()
+			velocity = self.velocity_vector_view().length()
 
 			pump = self.pump_efficiency() * self.max_pump
 
-			self.direction = dir_vect.scale_absolute(velocity + pump).vect
+			vect = self.velocity_vector_view().scale_absolute_inplace(velocity + pump).vect
+			self.direction.set(vect.x, vect.y)
 
 	def on_tick(self):
 		# Get the board vector
-		board = self.board_vector().vect
+		board = self.board_vector_view().vect
+		bx, by = board.x, board.y
 
 		# Calculate the new direction
-		player = self.player_vector().vect
-		new_dir = board.transform(player)
+		player = self.player_vector_view().vect
+		new_dir = self.direction.set(bx + player.x, by + player.y)
 
 		#You can not go backwards
 		if new_dir.y < 0:
-			new_dir.y = 0
+			new_dir.y = 0.0
 
 		# You can only go a certain speed
 		# and you are slowed down if above a certain speed
-		vector = Vector(Point(0,0), new_dir)
+		vector = self.velocity_vector_view()
+		length = vector.length()
 
 		#scale = -1
-		if vector.length() > self.break_speed:
-			scale = float(vector.length()) - self.slowed
-			new_dir = vector.scale_absolute(scale).vect
+		if length > self.break_speed:
+			scale = float(length) - self.slowed
+			vect = vector.scale_absolute_inplace(scale).vect
+			new_dir.set(vect.x, vect.y)
 
-		if vector.length() > self.max_speed:
+		if length > self.max_speed:
 			# Jitter player
-			change = random.uniform(-self.jitter, self.jitter) # * vector.length() / self.max_speed
+			change = self.random.uniform(-self.jitter, self.jitter) # * vector.length() / self.max_speed
 			if abs(self.player + change) < self.max_lean:
 				self.player += change
 
-		new_pos = self.position.transform(new_dir)
-
-		self.direction = new_dir
-		self.position = new_pos
+		self.position.transform_into(new_dir)
 
 
 class ConstantMoving(object):
@@ -162,14 +204,22 @@ class ConstantMoving(object):
 		self.rotation = rotation
 
 	def on_tick(self, speed):
-		self.position = self.position.transform(self.moving)
+		self.position.transform_into(self.moving)
 		self.position.y -= speed
 
 
 class Rectangular(ConstantMoving):
-	def __init__(self, position, moving, rotation, image, size_x = False):
+	def __init__(self, position, moving, rotation, image, size_x = False, key = None):
+		'''
+			key is the (category, name) of the image, used to draw games with other images (headless ones).
+		'''
+		self.reset(position, moving, rotation, image, size_x, key)
+
+	def reset(self, position, moving, rotation, image, size_x = False, key = None):
+		'''Sets up a new or recycled obstacle (takes the arguments of __init__, see Game.spawn)'''
 		ConstantMoving.__init__(self, position, moving, rotation)
 		self.img = image
+		self.key = key
 		self.size = image.get_size()
 		if size_x:
 			factor = float(size_x)/self.size[0]
@@ -178,6 +228,9 @@ class Rectangular(ConstantMoving):
 	def on_tick(self, speed):
 		super(Rectangular, self).on_tick(speed)
 
+	def extent(self):
+		return max(self.size) / 2.0
+
 	def check_collision(self, point):
 		h_x = float(self.size[0])/2
 		h_y = float(self.size[1])/2
@@ -187,29 +240,46 @@ class Rectangular(ConstantMoving):
 		else:
 			return False
 
+	def check_segment(self, segment):
+		'''Collision with a segment (a Vector) anywhere between its points'''
+		return segment.rect_collision(self.position, float(self.size[0])/2, float(self.size[1])/2)
+
 
 class Boost(Rectangular):
-	def __init__ (self, position, moving, rotation, image, size_x = False, speed = 0):
-		Rectangular.__init__(self, position, moving, rotation, image, size_x)
+	def __init__ (self, position, moving, rotation, image, size_x = False, speed = 0, key = None):
+		self.reset(position, moving, rotation, image, size_x, speed, key)
+
+	def reset(self, position, moving, rotation, image, size_x = False, speed = 0, key = None):
+		Rectangular.reset(self, position, moving, rotation, image, size_x, key)
 		self.speed = speed
 
 
 class CircularObstacle(object):
-	def __init__(self, position, rotation, radius, image, speed = 0):
+	def __init__(self, position, rotation, radius, image, speed = 0, key = None):
+		self.reset(position, rotation, radius, image, speed, key)
+
+	def reset(self, position, rotation, radius, image, speed = 0, key = None):
 		self.radius = radius
 		self.position = position
 		self.img = image
+		self.key = key
 		self.rotation = rotation
 		self.speed = float(speed)
 
 	def on_tick(self, speed_y):
 		self.position.y -= speed_y
 
+	def extent(self):
+		return self.radius
+
 	def check_collision(self, point):
-		if Vector(point, self.position).length() < self.radius:
-			return True
-		else:
-			return False
+		dx = self.position.x - point.x
+		dy = self.position.y - point.y
+		return dx * dx + dy * dy < self.radius * self.radius
+
+	def check_segment(self, segment):
+		'''Collision with a segment (a Vector) anywhere between its points'''
+		return segment.distance_sq(self.position) < self.radius * self.radius
 
 
 
@@ -235,7 +305,7 @@ class FloatingText(object):
 	def on_tick(self):
 		if self.frames_left:
 			self.frames_left -= 1
-			self.position = self.position.transform(self.movement)
+			self.position.transform_into(self.movement)
 
 			# Check if font is faded
 			if self.fading and self.frames_left <= self.fading:
@@ -246,10 +316,72 @@ class FloatingText(object):
 		color = [int(c * self.intensity) for c in self.color]
 		return tuple(color)
 
+	def get_alpha(self):
+		# The intensity as alpha value (used instead of rendering every faded color)
+		return int(255 * self.intensity)
+
+
+class InputRecorder(object):
+	def __init__(self, seed, parameters = None):
+		'''
+			The input flags of every tick of a game (and the seed of the game),
+			enough to replay it exactly (see replay).
+		'''
+		self.seed = seed
+		self.parameters = parameters
+		self.flags = bytearray()
+
+	def __len__(self):
+		return len(self.flags)
+
+	def record(self, flags):
+		self.flags.append(flags)
+
+	def save(self, filename):
+		data = {'seed': self.seed, 'parameters': self.parameters,
+			'inputs': base64.b64encode(zlib.compress(bytes(self.flags))).decode('ascii')}
+		with open(filename, 'w') as f:
+			json.dump(data, f)
+
+	@classmethod
+	def load(cls, filename):
+		with open(filename) as f:
+			data = json.load(f)
+
+		parameters = data['parameters']
+		if parameters:
+			# json only has str keys
+			parameters['elements'] = {int(k): v for k, v in parameters['elements'].items()}
+
+		recorder = cls(data['seed'], parameters)
+		recorder.flags = bytearray(zlib.decompress(base64.b64decode(data['inputs'])))
+		return recorder
+
 
 class Game(object):
-	def __init__(self, parameters):
+	def __init__(self, parameters, images = None, clock = None, seed = None):
+		'''
+			images is an Assets instance or a dict like it (default: bmps).
+			clock is the game clock of the checkpoints (see clock.py), by default a
+			TickClock at 40 ticks per second.
+			seed seeds the random stream used for everything random in the game
+			(a random seed is chosen if None, see self.seed).
+		'''
 		self.parameters = parameters
+		self.images = images if images is not None else bmps
+		self.clock = clock if clock is not None else TickClock()
+
+		if seed is None:
+			seed = random.getrandbits(64)
+		self.seed = seed
+		self.random = random.Random(seed)
+
+		# All inputs are recorded (see apply_input)
+		self.recorder = InputRecorder(seed)
+		self.input_flags = 0
+
+		# Measures the phases of on_tick (see profiler.FrameProfiler)
+		self.profiler = NullProfiler()
 		self.general = parameters['general']
 		self.size = self.general['street_size']
 
@@ -257,18 +389,30 @@ class Game(object):
 		direction = Point(0, 10)
 
 		# Add parameters to board dict and create an instance
-		board_params = parameters['board']
-		board_params.update({'direction': Point(0, 5), 'start': self.start})
-		self.board = SlalomBoard(**board_params)
+		board_params = dict(parameters['board'], direction = Point(0, 5), start = self.start)
+		self.board = SlalomBoard(random = self.random, **board_params)
 
-		self.obstacles = []
+		self.clear_obstacles()
+		# Obstacles which left the screen, by class, recycled by spawn
+		self.free = {CircularObstacle: [], Rectangular: [], Boost: []}
 		self.texts = []
-		self.markings = []
-		self.trail = []
+		# The last board positions as (x, y), general parameter trail_length (default: start_pos / 2)
+		self.trail = deque(maxlen = int(self.general.get('trail_length', self.start.y / 2)))
 
-		self.last_random = 0
 		self.last_milestone = 0
 		self.speed_warning = 0
+		# The board position at the last spawn slot
+		self.last_slot = 0
+
+		self.ticks = 0
+		self.last_hit = None
+		# The movement of the board during the last tick and the segment used to test it
+		self.sweep = Point(0, 0)
+		self.segment = Vector(Point(0, 0), Point(0, 0))
+		# Set when a checkpoint was missed (the game goes on)
+		self.game_over = False
+		# A replay.ReplayWriter which records every tick (None: no replay)
+		self.replay = None
 
 		# Setup checkpoint system
 		self.dist_checkpoint = int(self.general['dist_checkpoint'])
@@ -278,17 +422,64 @@ class Game(object):
 		self.num_checkpoint = 0
 
 		self.next_checkpoint = int(self.dist_checkpoint)
-		self.last_checkpoint = time.clock()
+		self.last_checkpoint = self.clock.now()
 
 		self.setup_game()
 
 	def setup_game(self):
-		# Setup parameters (position 0 are initial parameters)
-		self.set_parameters(self.parameters['elements'][0])
-		# and remove parameters
-		del self.parameters['elements'][0]
-		if self.parameters['elements']:
-			self.next_upd = min(self.parameters['elements'].keys())
+		# The map elements compiled into a timeline (the parameters are not changed),
+		# the first element holds the initial parameters
+		self.timeline = MapTimeline.compile(self.parameters['elements'])
+		self.map_cursor = TimelineCursor(self.timeline)
+		self.set_parameters(self.map_cursor.element)
+
+		self.spawns = self.spawn_stream()
+
+	def clear_obstacles(self):
+		self.obstacles = []
+		# general parameter obstacle_store: 'grid' (default) or 'array' (store.ObstacleStore, needs numpy)
+		if self.general.get('obstacle_store', 'grid') == 'array':
+			from store import ObstacleStore
+			self.store = ObstacleStore()
+			self.grid = None
+		else:
+			self.store = None
+			self.grid = ObstacleGrid()
+
+	def seek(self, distance):
+		'''
+			Moves the board to distance (y) as if it had ridden there: the map element and
+			the checkpoints are set up from the timeline without replaying the ticks.
+			The obstacles, texts and the trail are cleared.
+		'''
+		px = int(distance)
+		self.board.position.y = distance
+		self.board.currently_on = False
+		self.sweep.set(0.0, 0.0)
+
+		self.clear_obstacles()
+		self.texts = []
+		self.trail.clear()
+
+		self.map_cursor.seek(px)
+		self.set_parameters(self.map_cursor.element)
+
+		# The checkpoints passed on the way
+		self.dist_checkpoint = int(self.general['dist_checkpoint'])
+		self.time_checkpoint = int(self.general['time_checkpoint'])
+		self.num_checkpoint = 0
+		self.next_checkpoint = self.dist_checkpoint
+		while px > self.next_checkpoint and self.dist_checkpoint > 0:
+			self.num_checkpoint += 1
+			self.next_checkpoint += self.dist_checkpoint
+			self.time_checkpoint += self.delta_time
+			self.dist_checkpoint += self.delta_dist
+		self.last_checkpoint = self.clock.now()
+
+		self.last_slot = px
+		self.last_milestone = px - px % 10000
+		self.speed_warning = 0
+		self.game_over = False
 
 	def set_parameters(self, parameters):
 		self.step_size = parameters['step_size']
@@ -297,8 +488,7 @@ class Game(object):
 		self.boosts = parameters['boosts']
 
 		self.forward_cars = parameters['forward_cars']
-		self.backwards_cars = parameters['backwards_cars']
-		self.backwards_cars.update({'forward': False})
+		self.backwards_cars = dict(parameters['backwards_cars'], forward = False)
 
 		if parameters['message']:
 			start = Point(self.start.x, self.size[1] - 50)
@@ -315,184 +505,248 @@ class Game(object):
 		return self.board.player_vector()
 
 
-	def random_boost(self, probability = 0.01, size = (40, 60), speed = (30, 40)):
-		if random.random() < probability:
-			y = self.size[1] + 500
-			x = random.randrange(0, self.size[0])
-
-			width = random.randrange(size[0], size[1])
-			speed = random.randrange(speed[0], speed[1])
-			rotation = 180
-
-			key = random.choice(bmps['boosts'].keys())
-			self.obstacles.append(Boost(Point(x, y), Point(0,0), rotation, bmps['boosts'][key], width, speed))
+	def apply_input(self, flags):
+		'''
+			Apply the input flags (LEFT, RIGHT, PUMP, BRAKE) of one tick to the board.
+		'''
+		self.input_flags |= flags
 
+		if flags & PUMP:
+			self.board.pump()
+		if flags & LEFT:
+			self.board.lean(True)
+		if flags & RIGHT:
+			self.board.lean(False)
+		if flags & BRAKE:
+			self.board.break_board()
 
-	def random_pothole(self, probability = 0.01, size = (3, 20), speed = (50, 80)):
-		if random.random() < probability:
-			# Create a random circular obstacle (with pothole image)
-			y = self.size[1] + 500
 
-			# Do not set obstacles in the middle or too far outside
-			x = random.randrange(30, (self.size[0] / 2) - 20)
-			if random.random()>0.5:
-				x = self.start.x - x
-			else:
-				x = self.start.x + x
+	def spawn_stream(self):
+		'''
+			The obstacles come from a spawn.SpawnStream seeded by the game seed.
+			General parameters: spawn_thread generates them on a background thread,
+			spawn_file plays a baked course instead.
+		'''
+		if self.general.get('spawn_file'):
+			return SpawnStream.load(self.general['spawn_file'])
+		return SpawnStream(self.timeline, self.size, self.images, 'spawn {}'.format(self.seed),
+			background = bool(self.general.get('spawn_thread')))
 
-			radius = random.randrange(size[0], size[1]+1)
-			rotation = random.randrange(0, 360)
-			speed = random.randrange(speed[0], speed[1]+1)
+	def close(self):
+		'''Stops the background thread of the spawn stream (the game can not go on)'''
+		self.spawns.close()
 
-			key = random.choice(bmps['potholes'].keys())
-			self.obstacles.append(CircularObstacle(Point(x, y), rotation, radius, bmps['potholes'][key], speed))
 
-	def random_car(self, probability = 0.01, size = (20, 25), moving = (10, 14), forward = True):
-		if random.random() < probability:
-			size_x = random.randrange(size[0], size[1])
+	def spawn_record(self, record):
+		'''Adds the obstacle of a spawn record'''
+		y = record.y
 
-			x = random.randrange(50, (self.size[0] / 2) - 50)
+		if record.kind == 'pothole':
+			image = self.images['potholes'][record.key]
+			self.spawn(CircularObstacle, Point(record.x, y), record.rotation, record.size, image, record.speed, ('potholes', record.key))
 
-			forw_pos = self.size[1] + 300
-			rev_pos = -200
-			
-			if forward:
-				speed = Point(0, random.randrange(moving[0], moving[1]))
+		elif record.kind == 'boost':
+			image = self.images['boosts'][record.key]
+			self.spawn(Boost, Point(record.x, y), Point(0,0), record.rotation, image, record.size, record.speed, ('boosts', record.key))
 
-				if self.board.speed() > speed.y or random.random() < 0.5:
-					position = Point(self.start.x - x, forw_pos)
-				else:
-					position = Point(self.start.x - x, rev_pos)
-				rotation = 90
+		elif record.kind == 'car':
+			# Forward cars the board is not faster than may come from behind
+			if record.coin is not None and not (self.board.speed() > record.speed or record.coin < 0.5):
+				y = -200
+			image = self.images['cars'][record.key]
+			self.spawn(Rectangular, Point(record.x, y), Point(0, record.speed), record.rotation, image, record.size, ('cars', record.key))
 
-			else:
-				position = Point(self.start.x + x, forw_pos)
-				speed = Point(0, -random.randrange(moving[0], moving[1]))
-				rotation = 270
 
-			key = random.choice(bmps['cars'].keys())
-			image = bmps['cars'][key]
+	def add_obstacle(self, obstacle):
+		obstacle.serial = next(SERIALS)
+		self.obstacles.append(obstacle)
+		if self.store is not None:
+			self.store.add(obstacle)
+		else:
+			self.grid.add(obstacle)
 
-			car = Rectangular(position, speed, rotation, image, random.randrange(size[0], size[1]))
 
-			self.obstacles.append(car)
+	def spawn(self, cls, *args):
+		'''
+			Adds an obstacle of class cls (constructor arguments args),
+			an instance from the free list is reset instead of creating a new one.
+		'''
+		free = self.free[cls]
+		if free:
+			obstacle = free.pop()
+			obstacle.reset(*args)
+		else:
+			obstacle = cls(*args)
+		self.add_obstacle(obstacle)
+		return obstacle
 
 
-	def remove_obstacles(self):
-		len_ob = len(self.obstacles)
-		for i, o in enumerate(reversed(self.obstacles)):
-			if o.position.y < - 500 or o.position.y > 2 * self.size[1]:
-				self.obstacles.pop(len_ob - i -1)
+	def advance_obstacles(self, speed_y):
+		'''
+			Advances the obstacles and removes the ones far outside the screen in the same pass.
+			The list is compacted in place, so the remaining obstacles keep their order.
+		'''
+		obstacles = self.obstacles
+		lower = -500
+		upper = 2 * self.size[1]
+
+		if self.store is not None:
+			removed = self.store.advance(speed_y, lower, upper)
+			if removed:
+				removed_ids = set(id(o) for o in removed)
+				obstacles[:] = [o for o in obstacles if id(o) not in removed_ids]
+				for o in removed:
+					self.recycle(o)
+			return
 
+		alive = 0
+		for o in obstacles:
+			o.on_tick(speed_y)
+			if lower <= o.position.y <= upper:
+				obstacles[alive] = o
+				alive += 1
+			else:
+				self.grid.remove(o)
+				self.recycle(o)
+		del obstacles[alive:]
 
-	def remove_texts(self):
-		len_texts = len(self.texts)
-		for i, t in enumerate(reversed(self.texts)):
-			if t.frames_left == 0:
-				self.texts.pop(len_texts - i -1)
+		self.grid.scroll(speed_y)
 
 
-	def update_markings(self):
-		self.markings = []
+	def recycle(self, obstacle):
+		if self.board.currently_on is obstacle:
+			self.board.currently_on = False
+		self.free[type(obstacle)].append(obstacle)
 
-		pos = int(self.board.position.y)
-		lower = int(self.start.y)
-		upper = int(self.size[1])
 
-		for i in range(pos - lower, pos + upper):
-			if not i % 220:
-				self.markings.append(i - pos)
+	def advance_texts(self):
+		'''Advances the floating texts and removes the ones that are gone'''
+		texts = self.texts
+		alive = 0
+		for t in texts:
+			t.on_tick()
+			if t.frames_left:
+				texts[alive] = t
+				alive += 1
+		del texts[alive:]
 
 
 	def check_collision(self):
-		board = self.board_vector()
+		point = Point(self.board.position.x, self.start.y)
+		self.last_hit = None
 
 		# Check collision of board with wall
 		found = False
-		if board.p1.x < 0:
+		if point.x < 0:
 			self.board.position.x = 0
 			found = True
-		elif board.p1.x > self.size[0]:
+		elif point.x > self.size[0]:
 			self.board.position.x = self.size[0]
 			found = True
 
 		if found:
 			vector = Vector(Point(0,0), self.board.direction)
 			self.board.direction = vector.scale_absolute(3).vect
+			self.last_hit = 'wall'
 			return
 
-		# Check collision of board with any obstacle
-		found = False
-		vector = Vector(Point(0,0), self.board.direction)
-		cur = self.board.currently_on
-		for ob in self.obstacles:
-			if ob.check_collision(board.p1):
-				if type(ob) == CircularObstacle:
-					if cur == id(ob): break
-					cur = self.board.speed()
-					breaking = 1 - (ob.speed / 100)
-					if cur * breaking > self.board.break_speed:
-						self.board.direction = vector.scale_relative(breaking).vect
-
-					self.board.currently_on = id(ob)
-					break
-
-				elif type(ob) == Boost:
-					if cur == id(ob): break
-					speed =  1 + float(ob.speed)/100
-					if self.board.speed() * speed <= self.board.max_speed * 1.03:
-						self.board.direction = vector.scale_relative(speed).vect
-
-					self.board.currently_on = id(ob)
-					break
-
-				elif type(ob) == Rectangular:
-					if cur == id(ob): break
-
-					self.board.direction = vector.scale_absolute(1).vect
-
-					self.board.currently_on = id(ob)
-					break
-		else:
+		# Check collision of board with the first spawned obstacle under it
+		ob = self.obstacle_at(point)
+		if ob is None:
 			self.board.currently_on = False
+			return
+
+		if self.board.currently_on is ob:
+			return
+
+		vector = Vector(Point(0,0), self.board.direction)
+		if type(ob) == CircularObstacle:
+			cur = self.board.speed()
+			breaking = 1 - (ob.speed / 100)
+			if cur * breaking > self.board.break_speed:
+				self.board.direction = vector.scale_relative(breaking).vect
+
+			self.board.currently_on = ob
+			self.last_hit = 'pothole'
+
+		elif type(ob) == Boost:
+			speed =  1 + float(ob.speed)/100
+			if self.board.speed() * speed <= self.board.max_speed * 1.03:
+				self.board.direction = vector.scale_relative(speed).vect
+
+			self.board.currently_on = ob
+			self.last_hit = 'boost'
+
+		elif type(ob) == Rectangular:
+			self.board.direction = vector.scale_absolute(1).vect
+
+			self.board.currently_on = ob
+			self.last_hit = 'car'
+
+
+	def obstacle_at(self, point):
+		'''
+			Returns the first spawned obstacle the board touched during the last tick or None.
+
+			Relative to the street the board moved from point - self.sweep to point, relative
+			to an obstacle it additionally moved by the obstacle's own movement. The whole
+			segment is tested, so fast boards can not pass small obstacles between two ticks.
+		'''
+		sweep = self.sweep
+		if self.store is not None:
+			return self.store.first_hit(point.x, point.y, sweep.x, sweep.y)
+
+		x = point.x - sweep.x
+		y = point.y - sweep.y
+		segment = self.segment
+		for ob in self.grid.query(point, abs(sweep.y) + self.grid.moving_reach):
+			moving = getattr(ob, 'moving', None)
+			if moving is not None:
+				segment.set(x + moving.x, y + moving.y, point.x, point.y)
+			else:
+				segment.set(x, y, point.x, point.y)
+			if ob.check_segment(segment):
+				return ob
+		return None
 
 	def on_tick(self):
-		# Advance board
+		self.ticks += 1
+		self.clock.tick()
+		flags = self.input_flags
+		self.recorder.record(flags)
+		self.input_flags = 0
+		profiler = self.profiler
+
+		# Advance board (and keep its movement relative to the street for the collisions)
+		profiler.mark('advance')
+		x = self.board.position.x
 		self.board.on_tick()
+		self.sweep.set(self.board.position.x - x, self.board.direction.y)
 
-		# Advance obstacles
-		speed_y = self.board.direction.y
-		[o.on_tick(speed_y) for o in self.obstacles]
-
-		#Advance Floating texts
-		[t.on_tick() for t in self.texts]
+		# Advance obstacles & floating texts (and clean up)
+		self.advance_obstacles(self.board.direction.y)
+		self.advance_texts()
 
+		profiler.mark('collision')
 		self.check_collision()
-		self.update_markings()
 
-		self.trail.append(self.board.position)
-		if len(self.trail) > self.start.y/2:
-			self.trail.pop(0)
+		profiler.mark('spawn')
 
-		# Create new obstacles
-		px = int(self.board.position.y)
-		if px > self.last_random + self.step_size:
-			self.last_random = px
+		self.trail.append((self.board.position.x, self.board.position.y))
 
-			# Potholes
-			self.random_pothole(**self.obstacle_params)
-			# Forward and backwards cars
-			self.random_car(**self.forward_cars)
-			self.random_car(**self.backwards_cars)
-			# boosts
-			self.random_boost(**self.boosts)
+		# Create the obstacles of the next spawn slot every step_size
+		px = int(self.board.position.y)
+		if px > self.last_slot + self.step_size:
+			self.last_slot = px
+			for record in self.spawns.next_slot(self.map_cursor.index):
+				self.spawn_record(record)
 
 		# Check if player is over the next checkpoint
 		if px > self.next_checkpoint:
 			self.num_checkpoint += 1
 
 			self.next_checkpoint = self.next_checkpoint + self.dist_checkpoint
-			self.last_checkpoint = time.clock()
+			self.last_checkpoint = self.clock.now()
 
 			# Change time and distance
 			self.time_checkpoint += self.delta_time
@@ -503,21 +757,17 @@ class Game(object):
 			self.texts.append(text)
 
 		# Check if player has lost
-		if time.clock() > self.last_checkpoint + self.time_checkpoint:
+		if self.clock.now() > self.last_checkpoint + self.time_checkpoint:
 			start = Point(self.start.x, self.size[1] - 50)
 			text = FloatingText('GAME OVER', start, (245, 20, 20), 500, 100, 'helvetica', 80, Point(0, -1))
 			self.texts.append(text)
-			self.last_checkpoint = time.clock()
+			self.last_checkpoint = self.clock.now()
+			self.game_over = True
 
 		# Check if next map update is due
-		if self.parameters['elements']:
-			if px > self.next_upd:
-				# Set new parameters
-				self.set_parameters(self.parameters['elements'][self.next_upd])
-				del self.parameters['elements'][self.next_upd]
-
-				if self.parameters['elements']:
-					self.next_upd = min(self.parameters['elements'].keys())
+		element = self.map_cursor.advance(px)
+		if element is not None:
+			self.set_parameters(element)
 
 
 		# Display how far player is
@@ -531,249 +781,282 @@ class Game(object):
 		if self.speed_warning:
 			self.speed_warning -= 1
 
-		if self.board_vector().length() > self.board.max_speed and not self.speed_warning:
+		if self.board.speed() > self.board.max_speed and not self.speed_warning:
 			self.speed_warning = 50
 			start = Point(self.start.x, self.size[1] - 50)
 			text = FloatingText('Too Fast!', start, (245, 5, 5), 200, 50, 'helvetica', 50, Point(0, -2))
 			self.texts.append(text)
 
-		# Clean up obstacles & floating texts
-		self.remove_obstacles()
-		self.remove_texts()
+		if self.replay is not None:
+			self.replay.record(self, flags)
 
 
-## Setting up pygame and the main gameloop
-# all the pygame stuff
-def start_game(parameters):
-	pygame.init()
-	fpsClock = pygame.time.Clock()
-
-	# The game size and the player start position
+def setup_parameters(parameters):
+	'''
+		Returns a copy of parameters with the derived general parameters
+		(street_size and the absolute start_pos) set up for a Game.
+	'''
+	parameters = deepcopy(parameters)
 	general_params = parameters['general']
-	game_size = parameters['general']['size']
+	game_size = general_params['size']
 
 	# board_size is minus the border
 	general_params['street_size'] = (game_size[0] - 2 * general_params['border_size'], game_size[1])
-	
-
-	# transpose vector (because of border):
-	t_vect = Point(general_params['border_size'], 0)
 
-	middle = game_size[0] / 2
 	start_pos = general_params['street_size'][1] / general_params['start_pos']
 	general_params.update({'start_pos': start_pos})
 
-	window = pygame.display.set_mode(game_size)
-	pygame.display.set_caption('Slalom Boarding')
+	return parameters
 
-	# colors
-	white = pygame.Color(245, 245, 245)
-	brown = pygame.Color(133, 60, 8)
-	black = pygame.Color(5, 8, 7)
-	red = pygame.Color(255, 30, 30)
-	green = pygame.Color(28, 100, 22)
-	bright_green = pygame.Color(20, 245, 18)
-	blue = pygame.Color(5, 10, 145)
 
-	# Create the game instance
-	game = Game(parameters)
+## Headless simulation (no window, no images, no frame rate limit)
+def simulate(parameters, inputs = None, ticks = 1000, tick_rate = 40, seed = None):
+	'''
+		Runs a game for a number of ticks without any display.
 
-	# Some drawing helpers
-	def draw_image(bmp, point, rotation = 0, size_x = 10):
-		scale = float(size_x) / bmp.get_size()[0]
-		# Rotozoom image
-		rotated = pygame.transform.rotozoom(bmp, rotation, scale)
+		inputs is either a sequence with the input flags (LEFT, RIGHT, PUMP, BRAKE) for each tick
+		(missing ticks have no input) or a function game -> flags which is called every tick.
+		The checkpoint clock is a TickClock (ticks / tick_rate), not wall time.
+		seed is passed to the Game, the recorded inputs are in game.recorder.
 
-		#get the rect of the rotated surf and set it's center to the oldCenter
-		rotRect = rotated.get_rect()
-		point = point.transform(t_vect)
-		rotRect.center = (point.x, point.y)
+		Returns the final game and a dict with a list of per tick metrics for:
+			x, y, speed, lean, hit (None, 'wall', 'pothole', 'boost' or 'car') and checkpoint
+	'''
+	original = parameters
+	parameters = setup_parameters(parameters)
 
-		window.blit(rotated, rotRect)
+	game = Game(parameters, headers, clock = TickClock(tick_rate), seed = seed)
+	game.recorder.parameters = deepcopy(original)
 
-	def draw_text(text, position, font = 'helvetica', size = 30, color = (250,240,245)):
-		fontObj = pygame.font.SysFont(font, size)
-		label = fontObj.render(text, 3, color)
+	metrics = {'x': [], 'y': [], 'speed': [], 'lean': [], 'hit': [], 'checkpoint': []}
 
-		# Center on point
-		rect = label.get_rect()
-		# position = position.transform(t_vect)
-		rect.center = (position.x, position.y)
+	for tick in range(ticks):
+		if callable(inputs):
+			flags = inputs(game)
+		elif inputs is not None and tick < len(inputs):
+			flags = inputs[tick]
+		else:
+			flags = 0
 
-		window.blit(label, rect)
+		game.apply_input(flags)
+		game.on_tick()
 
-	# The game loop
-	while True:
-		# Draw Street and Borders
-		window.fill(black)
-		b1 = pygame.Rect(0, 0, general_params['border_size'], game_size[1])
-		b2 = pygame.Rect(game_size[0] - general_params['border_size'], 0, general_params['border_size'], game_size[1])
-		pygame.draw.rect(window, green, b1)
-		pygame.draw.rect(window, green, b2)
-
-		# Draw road markings
-		for m in game.markings:
-			pygame.draw.line(window, white, (middle, m), (middle, m+80), 10)
-
-		# Draw all the obstacles
-		for o in game.obstacles:
-			if type(o) in (Rectangular, Boost):
-				size = o.size[0]
-			elif type(o) == CircularObstacle:
-				size = o.radius * 2
-
-			if o.position.y < game_size[1]:
-				draw_image(o.img, o.position, o.rotation, size)
+		board = game.board
+		metrics['x'].append(board.position.x)
+		metrics['y'].append(board.position.y)
+		metrics['speed'].append(board.speed())
+		metrics['lean'].append(board.player)
+		metrics['hit'].append(game.last_hit)
+		metrics['checkpoint'].append(game.num_checkpoint)
 
-			else:
-				if type(o) == Boost:
-					img = bmps['signs']['arrow_up_green']
-				else:
-					img = bmps['signs']['arrow_up']
-
-				width = size - (size * (o.position.y - game_size[1]) / 500)
-				pos = Point(o.position.x, game_size[1] - 30)
-				draw_image(img, pos, 0, width)
-				#pygame.draw.circle(window, white, [int(o.position.x), game_size[1] - 10], o.radius, 0)
-
-		# Draw the checkpoint line
-		dist_left = game.next_checkpoint - game.board.position.y
-		if dist_left < game_size[1] - start_pos:
-			y = start_pos + dist_left
-			cp = pygame.Rect(general_params['border_size'], y, game_size[0] - general_params['border_size'], 5)
-			pygame.draw.rect(window, blue, cp)
+	return game, metrics
+
+
+def weave_policy(game):
+	'''
+		A simple bot for simulate: weaves around the middle of the street and pumps at full lean.
+	'''
+	board = game.board
+	side = 1 if (game.ticks // 20) % 2 else -1
+	wanted = side * 0.6 * board.speed() + 0.01 * (game.start.x - board.position.x)
+
+	flags = LEFT if board.direction.x > wanted else RIGHT
+	if abs(board.player) >= 0.9 * board.max_lean:
+		flags |= PUMP
+	return flags
+
+
+def replay(recorder, parameters = None, tick_rate = 40):
+	'''
+		Replays an InputRecorder headless, returns the same as simulate.
+		parameters default to the ones saved in the recording.
+	'''
+	if parameters is None:
+		parameters = recorder.parameters
+	return simulate(parameters, recorder.flags, len(recorder), tick_rate, recorder.seed)
+
+
+## Setting up pygame and the main gameloop
+# all the pygame stuff
+# The example game (also used by the benchmarks)
+example_parameters = {
+	'general': {
+		'size': (900, 650),
+		'border_size': 75,
+		'start_pos': 8.0,
+
+		# The loop in the level
+		'loop_start': 10000,
+		'loop_stop': 20000,
 		
-		# Show trail
-		position = game.board.position
-		for i, point in enumerate(reversed(game.trail)):
-			point = point.transform(t_vect)
-			y =  point.y - position.y + start_pos
-			pygame.draw.circle(window, red, (int(point.x), int(y)), 1, 0)
-
-		# Show board vector
-		pos = game.board_vector().scale_absolute(20)# .transform(t_vect)	
-		angle = game.board_vector().angle()
-		draw_image(bmps['boards']['standard'], pos.p1, -angle, 75)
-
-		# And player vector
-		pl = game.player_vector().transform(t_vect)
-		pygame.draw.line(window, blue, pl.p1.coordinates(), pl.relative_point(110).coordinates(), 10)
-
-		# And the player
-		# pl = game.player_vector().scale_relative(150)
-		#if game.board.player > 0:
-		#	img = bmps['player']['front']
-		#else:
-		#	img = bmps['player']['back']
-		#angle = ((-pl.angle() + 90) % 360)
-
-		#draw_image(img, pl.relative_point(0.5), angle, pl.length())
-
-		# Show whether the player can push again
-		if not game.board.pump_blocked:
-			# A rectangle if pushing is possible
-			pump = game.board.pump_efficiency()
-			g = 20 + int(235 * pump)
-			height = 10 + int(50 * pump)
-
-			color = pygame.Color(10, g, 10)
-			rect = pygame.Rect(general_params['border_size'] + 10, 10, 10, height)
-			pygame.draw.rect(window, color, rect)
-		else:
-			pygame.draw.circle(window, red, (general_params['border_size'] + 20,20), 10, 0)
+		# The checkpoint parameters
+		'dist_checkpoint': 5000,
+		'time_checkpoint': 33.0,
+		'delta_time': -1.0,
+		'delta_dist': 2500
+	},
+
+	'elements': {0: {
+		'message': 'First',
+		'step_size': 20,
+		'obstacles' : {'probability': 0.02, 'size': (30, 40), 'speed': (20, 20)},
+		'boosts': {'probability': 0.0, 'size': (40, 50), 'speed': (20, 40)},
+		'forward_cars': {'probability': 0.007, 'size': (50, 75), 'moving': (8, 14)},
+		'backwards_cars': {'probability': 0.005, 'size': (50, 75), 'moving': (3, 8)},
+		},
+		10000: {
+		'step_size': 20,
+		'message': 'Second',
+		'obstacles' : {'probability': 0.05, 'size': (30, 40), 'speed': (50, 50)},
+		'boosts': {'probability': 0.1, 'size': (60, 80), 'speed': (20, 40)},
+		'forward_cars': {'probability': 0.005, 'size': (80, 100), 'moving': (8, 14)},
+		'backwards_cars': {'probability': 0.005, 'size': (80, 100), 'moving': (3, 8)}
+		}
+		},
+	'board': {
+		'max_lean': 0.026, 'lean_vel': 0.0015, 'max_speed': 24,
+		'jitter': 0.025, 'break_speed': 1, 'slowed': 0.05,
+		'break_effect': 1.5, 'max_pump': 4.5, 'optimal_velocity': 10,
+		'sigma': 13
+		}
+}
 
-		# Show current speed and fps
-		speed = game.board.speed()
-		text = str(int(round(2 * speed)))
-		if speed > game.board.max_speed:
-			c = (245, 10, 10)
-		else:
-			c = (245, 245, 245)
-		draw_text(text, Point(general_params['border_size'] + 55, 22), size = 30, color = c)
 
-		fps = str(int(fpsClock.get_fps())) + ' fps'
-		draw_text(fps, Point(game_size[0] - general_params['border_size'], 20), size = 25)
+def start_game(parameters):
+	# pygame is only imported when playing (headless use does not need it)
+	import pygame
+	from pygame.locals import QUIT, KEYDOWN, K_LEFT, K_RIGHT, K_SPACE, K_DOWN
+	from render import Renderer
+	from pipeline import InputState, SimulationThread, SnapshotBuffer, take
+	from profiler import FrameProfiler, ProfilerOverlay
+	from clock import RealClock
 
-		# Overlay texts
-		for t in game.texts:
-			draw_text(t.text, t.position.transform(t_vect), t.font, t.size, t.get_color())
+	pygame.init()
+	fpsClock = pygame.time.Clock()
 
-		# Show time and distance left
-		time_left = round(game.time_checkpoint + game.last_checkpoint - time.clock(), 1)
-		dist_left = round(float(game.next_checkpoint - game.board.position.y) / 100, 0)
-		draw_text(str(time_left) + 's', Point(game_size[0] - general_params['border_size'], 40), 'helvetica', 25, white)
-		draw_text(str(dist_left) + 'm', Point(game_size[0] - general_params['border_size'], 60), 'helvetica', 25, white)
+	# The game size and the player start position
+	original = deepcopy(parameters)
+	parameters = setup_parameters(parameters)
+	general_params = parameters['general']
+	game_size = general_params['size']
 
+	window = pygame.display.set_mode(game_size)
+	pygame.display.set_caption('Slalom Boarding')
+
+	# Images are converted to the display format for fast blitting
+	if general_params.get('asset_cache'):
+		bmps.cache_dir = general_params['asset_cache']
+	bmps.convert()
+
+	# Create the game instance (the inputs are saved to record_file on quit)
+	game = Game(parameters, clock = RealClock())
+	game.recorder.parameters = original
+	record_file = general_params.get('record_file')
+
+	# The whole game as a seekable replay (see replay.py)
+	writer = None
+	if general_params.get('replay_file'):
+		from replay import ReplayWriter
+		writer = ReplayWriter(general_params['replay_file'], game)
+
+	# Optional per phase profiling: 'profile' shows the overlay, 'profile_trace' is a csv/json file
+	trace_file = general_params.get('profile_trace')
+	if general_params.get('profile') or trace_file:
+		profiler = FrameProfiler(trace = bool(trace_file))
+	else:
+		profiler = NullProfiler()
+	overlay = ProfilerOverlay(profiler) if general_params.get('profile') else None
+
+	renderer = Renderer(window, general_params, bmps, profiler)
+
+	# The game ticks at TICK_RATE, independent of the frame rate (general parameter frame_rate,
+	# 0 is unlimited), the renderer draws snapshots interpolated between the last two ticks.
+	# When the simulation is behind by more than max_catch_up ticks the rest is dropped
+	# (the game slows down instead of falling further behind).
+	frame_rate = general_params.get('frame_rate', 120)
+	max_catch_up = general_params.get('max_catch_up', 5)
+	tick_time = 1.0 / TICK_RATE
+	inputs = InputState()
+
+	# With sim_thread (default) the game ticks on its own thread, otherwise the ticks due are run
+	# before each frame. The profiler is not thread safe, so the phases of the ticks are only
+	# profiled without the thread.
+	threaded = general_params.get('sim_thread', True)
+	if threaded:
+		snapshots = SnapshotBuffer()
+		simulation = SimulationThread(game, inputs, snapshots, TICK_RATE, max_catch_up)
+		simulation.start()
+	else:
+		game.profiler = profiler
+		snapshot = take(game)
+		accumulator = 0.0
+		last = time.perf_counter()
+
+	# The game loop
+	while True:
 		#Handle events (single press, not hold)
+		profiler.mark('events')
 		quitted = False
 		for event in pygame.event.get():
 			if event.type == QUIT:
-				pygame.quit()
 				quitted = True
-
 			elif event.type == KEYDOWN and event.key == K_SPACE:
-				game.board.pump()
-		
+				inputs.pump()
+
 		if quitted:
+			if threaded:
+				simulation.stop()
+			game.close()
+			pygame.quit()
+			if record_file:
+				game.recorder.save(record_file)
+			if writer:
+				writer.close()
+			if trace_file:
+				profiler.export(trace_file)
 			break
-		else:
-			# Check for pressed leaning keys
-			keys = pygame.key.get_pressed()
-			if keys[K_LEFT]:
-				game.board.lean(True)
-			if keys[K_RIGHT]:
-				game.board.lean(False)
-			if keys[K_DOWN]:
-				game.board.break_board()
 
-			pygame.display.update()
+		# Check for pressed leaning keys
+		keys = pygame.key.get_pressed()
+		inputs.set_held(keys[K_LEFT], keys[K_RIGHT], keys[K_DOWN])
 
-			game.on_tick()
+		now = time.perf_counter()
+		if threaded:
+			snapshot = snapshots.latest()
+			alpha = min(max((now - snapshot.time) / tick_time, 0.0), 1.0)
+		else:
+			accumulator += now - last
+			last = now
+			ticks = int(accumulator / tick_time)
+			if ticks > max_catch_up:
+				ticks = max_catch_up
+				accumulator = ticks * tick_time
+			accumulator -= ticks * tick_time
+
+			for _ in range(ticks):
+				game.apply_input(inputs.sample())
+				game.on_tick()
+			if ticks:
+				snapshot = take(game)
+			alpha = accumulator / tick_time
+
+		renderer.draw(snapshot, fpsClock.get_fps(), alpha)
+
+		if overlay:
+			profiler.mark('overlay')
+			overlay.draw(renderer)
+
+		# Only the rects changed by the frame (all of it on the first frame or without dirty_rects)
+		profiler.mark('display')
+		changed = renderer.changed()
+		if changed is None:
+			pygame.display.update()
+		else:
+			pygame.display.update(changed)
 
-			fpsClock.tick(40)
+		profiler.mark('wait')
+		fpsClock.tick(frame_rate)
+		profiler.end_frame()
 
 if __name__ == '__main__':
-
-	params = {	
-				'general': {
-					'size': (900, 650),
-					'border_size': 75,
-					'start_pos': 8.0,
-
-					# The loop in the level
-					'loop_start': 10000,
-					'loop_stop': 20000,
-					
-					# The checkpoint parameters
-					'dist_checkpoint': 5000,
-					'time_checkpoint': 33.0,
-					'delta_time': -1.0,
-					'delta_dist': 2500
-				},
-
-				'elements': {0: {
-					'message': 'First',
-					'step_size': 20,
-					'obstacles' : {'probability': 0.02, 'size': (30, 40), 'speed': (20, 20)},
-					'boosts': {'probability': 0.0, 'size': (40, 50), 'speed': (20, 40)},
-					'forward_cars': {'probability': 0.007, 'size': (50, 75), 'moving': (8, 14)},
-					'backwards_cars': {'probability': 0.005, 'size': (50, 75), 'moving': (3, 8)},
-					},
-					10000: {
-					'step_size': 20,
-					'message': 'Second',
-					'obstacles' : {'probability': 0.05, 'size': (30, 40), 'speed': (50, 50)},
-					'boosts': {'probability': 0.1, 'size': (60, 80), 'speed': (20, 40)},
-					'forward_cars': {'probability': 0.005, 'size': (80, 100), 'moving': (8, 14)},
-					'backwards_cars': {'probability': 0.005, 'size': (80, 100), 'moving': (3, 8)}
-					}
-					},
-				'board': {
-					'max_lean': 0.026, 'lean_vel': 0.0015, 'max_speed': 24,
-					'jitter': 0.025, 'break_speed': 1, 'slowed': 0.05,
-					'break_effect': 1.5, 'max_pump': 4.5, 'optimal_velocity': 10,
-					'sigma': 13
-					}
-				}
-
-	start_game(params)
\ No newline at end of file
+	start_game(example_parameters)
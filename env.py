@@ -0,0 +1,261 @@
+'''
+	Training environments: headless games stepped with input flags, in the style of gymnasium.
+
+	SlalomEnv is a single game:
+		obs, info = env.reset(seed)
+		obs, reward, terminated, truncated, info = env.step(action)
+
+	VecSlalomEnv steps n games in lockstep, batched in this process or in subprocesses.
+	Its observations, rewards and flags are numpy views of shared memory, the workers
+	write into them directly so nothing is pickled per step.
+
+	Actions are the engine input flags (LEFT | RIGHT | PUMP | BRAKE), an int in range(16).
+'''
+import multiprocessing as mp
+from copy import deepcopy
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+import engine
+from clock import TickClock
+from engine import CircularObstacle, Boost
+
+
+BOARD_FEATURES = 10
+OBSTACLE_FEATURES = 8
+NUM_ACTIONS = 16
+
+
+def observation_size(k):
+	return BOARD_FEATURES + k * OBSTACLE_FEATURES
+
+
+class SlalomEnv(object):
+	def __init__(self, parameters = None, k = 8, max_ticks = 4000, tick_rate = 40, hit_penalty = 1.0):
+		'''
+			parameters are game parameters (default: engine.example_parameters).
+			k is the number of nearest obstacles in the observation.
+			An episode is terminated when a checkpoint is missed and truncated after max_ticks.
+			The reward is the progress in meters minus hit_penalty for every hit of a pothole, car or wall.
+
+			The observation (float32, observation_size(k)) is, relative to the board:
+				x (-1 to 1 across the street), direction x and y, speed (per max_speed),
+				lean (per max_lean), pump efficiency, pump blocked, time and distance left
+				to the next checkpoint (fractions), on an obstacle
+			followed by the k nearest obstacles (in 100 pixels, nearest first, zero padded):
+				present, dx, dy, extent, y movement, pothole, boost, car
+		'''
+		self.parameters = parameters if parameters is not None else engine.example_parameters
+		self.k = k
+		self.max_ticks = max_ticks
+		self.tick_rate = tick_rate
+		self.hit_penalty = hit_penalty
+
+		self.observation_size = observation_size(k)
+		self.num_actions = NUM_ACTIONS
+		self.game = None
+		# Seed of the automatic reset in a VecSlalomEnv
+		self.next_seed = None
+
+	def reset(self, seed = None, out = None):
+		'''Starts a new game, returns (observation, info). The observation is written to out if given.'''
+		parameters = engine.setup_parameters(self.parameters)
+
+		self.close()
+		self.game = engine.Game(parameters, engine.headers, clock = TickClock(self.tick_rate), seed = seed)
+
+		return self.observe(out), {'seed': self.game.seed}
+
+	def step(self, action, out = None):
+		'''Applies the input flags action for one tick, returns (observation, reward, terminated, truncated, info)'''
+		game = self.game
+		y = game.board.position.y
+
+		game.apply_input(int(action))
+		game.on_tick()
+
+		reward = (game.board.position.y - y) / 100.0
+		if game.last_hit is not None and game.last_hit != 'boost':
+			reward -= self.hit_penalty
+
+		info = {'hit': game.last_hit, 'checkpoints': game.num_checkpoint}
+		return self.observe(out), reward, game.game_over, game.ticks >= self.max_ticks, info
+
+	def close(self):
+		if self.game is not None:
+			self.game.close()
+			self.game = None
+
+	def observe(self, out = None):
+		if out is None:
+			out = np.zeros(self.observation_size, np.float32)
+		else:
+			out[:] = 0
+
+		game = self.game
+		board = game.board
+		max_speed = float(board.max_speed)
+		half = game.size[0] / 2.0
+
+		out[0] = (board.position.x - half) / half
+		out[1] = board.direction.x / max_speed
+		out[2] = board.direction.y / max_speed
+		out[3] = board.speed() / max_speed
+		out[4] = board.player / board.max_lean
+		out[5] = board.pump_efficiency()
+		out[6] = 1.0 if board.pump_blocked else 0.0
+		# 0 without a time or distance between the checkpoints
+		if game.time_checkpoint > 0:
+			out[7] = (game.time_checkpoint + game.last_checkpoint - game.clock.now()) / game.time_checkpoint
+		else:
+			out[7] = 0.0
+		if game.dist_checkpoint > 0:
+			out[8] = (game.next_checkpoint - board.position.y) / float(game.dist_checkpoint)
+		else:
+			out[8] = 0.0
+		out[9] = 1.0 if board.currently_on else 0.0
+
+		obstacles = game.obstacles
+		if not obstacles or not self.k:
+			return out
+
+		# The k nearest obstacles to the contact point of the board
+		x = board.position.x
+		y = game.start.y
+		near = np.empty((len(obstacles), 5), np.float64)
+		for i, o in enumerate(obstacles):
+			moving = getattr(o, 'moving', None)
+			near[i] = (o.position.x - x, o.position.y - y, o.extent(), moving.y if moving is not None else 0.0, i)
+
+		order = np.argsort(near[:, 0] ** 2 + near[:, 1] ** 2, kind = 'stable')[:self.k]
+		features = out[BOARD_FEATURES:].reshape(self.k, OBSTACLE_FEATURES)
+		for row, i in zip(features, order):
+			dx, dy, extent, vy, index = near[i]
+			o = obstacles[int(index)]
+			row[:5] = (1.0, dx / 100.0, dy / 100.0, extent / 100.0, vy / 10.0)
+			if type(o) == CircularObstacle:
+				row[5] = 1.0
+			elif type(o) == Boost:
+				row[6] = 1.0
+			else:
+				row[7] = 1.0
+		return out
+
+
+class SharedBuffers(object):
+	def __init__(self, n, size, arrays = None):
+		'''
+			The step buffers of a VecSlalomEnv in shared memory (raw arrays, no locks):
+			actions, observations, rewards, terminated and truncated.
+		'''
+		if arrays is None:
+			arrays = (RawArray('B', n), RawArray('f', n * size), RawArray('d', n), RawArray('B', n), RawArray('B', n))
+		self.arrays = arrays
+		self.actions = np.frombuffer(arrays[0], np.uint8)
+		self.observations = np.frombuffer(arrays[1], np.float32).reshape(n, size)
+		self.rewards = np.frombuffer(arrays[2], np.float64)
+		self.terminated = np.frombuffer(arrays[3], np.bool_)
+		self.truncated = np.frombuffer(arrays[4], np.bool_)
+
+
+def run_envs(envs, indices, buffers, command, seed = None):
+	'''
+		Executes a command (reset or step) for the envs with the given indices.
+		Env i is reset with seed + i, the next automatic resets go on in steps of n.
+	'''
+	n = len(buffers.rewards)
+	for env, i in zip(envs, indices):
+		if command == 'reset':
+			env.next_seed = None if seed is None else seed + i + n
+			env.reset(None if seed is None else seed + i, buffers.observations[i])
+			buffers.rewards[i] = 0.0
+			buffers.terminated[i] = buffers.truncated[i] = False
+			continue
+
+		_, reward, terminated, truncated, _ = env.step(buffers.actions[i], buffers.observations[i])
+		buffers.rewards[i] = reward
+		buffers.terminated[i] = terminated
+		buffers.truncated[i] = truncated
+
+		# The observation of a finished game is the first one of the next game
+		if terminated or truncated:
+			env.reset(env.next_seed, buffers.observations[i])
+			if env.next_seed is not None:
+				env.next_seed += n
+
+
+def worker(connection, n, size, arrays, indices, env_kwargs):
+	buffers = SharedBuffers(n, size, arrays)
+	envs = [SlalomEnv(**env_kwargs) for _ in indices]
+	while True:
+		command, seed = connection.recv()
+		if command == 'close':
+			break
+		run_envs(envs, indices, buffers, command, seed)
+		connection.send(None)
+	for env in envs:
+		env.close()
+	connection.close()
+
+
+class VecSlalomEnv(object):
+	def __init__(self, n, parameters = None, processes = 0, **env_kwargs):
+		'''
+			n games stepped in lockstep (env_kwargs are passed to each SlalomEnv).
+			processes = 0 steps all games in this process, otherwise they are split
+			over that many subprocesses.
+
+			reset(seed) and step(actions) return numpy views of the shared buffers
+			(they are overwritten by the next call): game i is seeded with seed + i,
+			and a game which ended is reset with the seed n higher than its last one.
+		'''
+		self.n = n
+		env_kwargs['parameters'] = deepcopy(parameters if parameters is not None else engine.example_parameters)
+		self.observation_size = observation_size(env_kwargs.get('k', 8))
+		self.num_actions = NUM_ACTIONS
+		self.buffers = SharedBuffers(n, self.observation_size)
+
+		self.processes = []
+		self.envs = []
+		if processes:
+			context = mp.get_context()
+			for indices in np.array_split(np.arange(n), processes):
+				indices = indices.tolist()
+				parent, child = context.Pipe()
+				process = context.Process(target = worker, daemon = True,
+					args = (child, n, self.observation_size, self.buffers.arrays, indices, env_kwargs))
+				process.start()
+				child.close()
+				self.processes.append((process, parent))
+		else:
+			self.envs = [SlalomEnv(**env_kwargs) for _ in range(n)]
+
+	def command(self, command, seed = None):
+		if self.processes:
+			for _, connection in self.processes:
+				connection.send((command, seed))
+			for _, connection in self.processes:
+				connection.recv()
+		else:
+			run_envs(self.envs, range(self.n), self.buffers, command, seed)
+
+	def reset(self, seed = None):
+		'''Returns the observations (n, observation_size)'''
+		self.command('reset', seed)
+		return self.buffers.observations
+
+	def step(self, actions):
+		'''Returns observations, rewards, terminated, truncated (arrays over the n games)'''
+		b = self.buffers
+		b.actions[:] = actions
+		self.command('step')
+		return b.observations, b.rewards, b.terminated, b.truncated
+
+	def close(self):
+		for process, connection in self.processes:
+			connection.send(('close', None))
+			process.join()
+		self.processes = []
+		for env in self.envs:
+			env.close()
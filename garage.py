@@ -1,8 +1,8 @@
 import wx
-import pickle
 from os import path
 from copy import deepcopy
 
+import config
 import engine
 
 class DictPage(wx.Dialog):
@@ -340,21 +340,32 @@ class ConfigurationEditor(wx.Dialog):
 			self.selection[param] = current
 
 	def save_configuration(self, evt):
-		dlg = wx.FileDialog(self, 'Choose a filename', '', '', '*.conf', wx.SAVE)
+		# json for editing, .slc is the compiled form (see config.py)
+		wildcard = 'Configuration (*.json)|*.json|Compiled configuration (*.slc)|*.slc'
+		dlg = wx.FileDialog(self, 'Choose a filename', '', '', wildcard, wx.SAVE)
 		if dlg.ShowModal() == wx.ID_OK:
 			filename = dlg.GetFilename()
 			dirname = dlg.GetDirectory()
 			filepath = path.join(dirname, filename)
-			pickle.dump(self.configuration, open(filepath, "w"))
+			try:
+				config.save(self.configuration, filepath)
+			except config.ConfigError as e:
+				wx.MessageBox(str(e), 'Invalid configuration, not saved')
 
 	def load_configuration(self, evt):
-		dlg = wx.FileDialog(self, 'Choose a file', '', '', '*.conf', wx.OPEN)
+		# Old .conf pickles are migrated (save them again as json)
+		wildcard = 'Configuration (*.json;*.slc;*.conf)|*.json;*.slc;*.conf'
+		dlg = wx.FileDialog(self, 'Choose a file', '', '', wildcard, wx.OPEN)
 		if dlg.ShowModal() == wx.ID_OK:
 			filename = dlg.GetFilename()
 			dirname = dlg.GetDirectory()
 			filepath = path.join(dirname, filename)
 
-			self.configuration = pickle.load(open(filepath, "r"))
+			try:
+				self.configuration = config.load(filepath)
+			except config.ConfigError as e:
+				wx.MessageBox(str(e), 'Invalid configuration')
+				return
 			self.update()
 
 	def open_general(self, evt):
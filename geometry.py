@@ -1,7 +1,29 @@
 import math
 import random
 
+INF = float('inf')
+
+
+def slab(p, v, low, high, t_low, t_high):
+	'''
+		Narrows (t_low, t_high) to where p + t * v is strictly between low and high,
+		an empty interval is returned as (INF, -INF).
+	'''
+	if v == 0:
+		if low < p < high:
+			return t_low, t_high
+		return INF, -INF
+
+	t1 = (low - p) / v
+	t2 = (high - p) / v
+	if t1 > t2:
+		t1, t2 = t2, t1
+	return max(t_low, t1), min(t_high, t2)
+
+
 class Point(object):
+	__slots__ = ('x', 'y')
+
 	def __init__(self, x, y):
 		self.x = float(x)
 		self.y = float(y)
@@ -18,15 +40,38 @@ class Point(object):
 		y = self.y + ratio * vector.y
 		return Point(x, y)
 
+	def transform_into(self, vector, ratio = 1):
+		'''In place version of transform, returns self'''
+		self.x = self.x + ratio * vector.x
+		self.y = self.y + ratio * vector.y
+		return self
+
+	def set(self, x, y):
+		self.x = x
+		self.y = y
+		return self
+
 	def copy(self):
 		return Point(float(self.x), float(self.y))
 
 class Vector(object):
+	__slots__ = ('p1', 'p2', 'vect')
+
 	def __init__(self, p1, p2):
 		self.p1 = p1.copy()
 		self.p2 = p2.copy()
 		self.vect = Point(self.p2.x - self.p1.x, self.p2.y - self.p1.y)
 
+	def set(self, x1, y1, x2, y2):
+		'''Reuse this vector for the points (x1, y1) and (x2, y2), returns self'''
+		self.p1.x = x1
+		self.p1.y = y1
+		self.p2.x = x2
+		self.p2.y = y2
+		self.vect.x = x2 - x1
+		self.vect.y = y2 - y1
+		return self
+
 	def __str__(self):
 		return 'Vector:\n{}\n{})'.format(self.p1, self.p2)
 
@@ -34,25 +79,38 @@ class Vector(object):
 		return self.vect.copy()
 
 	def angle(self):
-		if self.length():
-			p1 = self.vect
-			p2 = Point(1, 0)
-			angle = math.acos( (p1.x * p2.x + p1.y * p2.y) / (math.sqrt(p1.x**2 + p1.y**2) * math.sqrt(p2.x**2 + p2.y**2)) )
-			return math.degrees(angle)
+		'''Angle to the x axis in degrees'''
+		length = self.length()
+		if length:
+			return math.degrees(math.acos(self.vect.x / length))
 		else:
 			return 0
 
 	def length(self):
 		return math.sqrt((self.vect.x**2) + (self.vect.y**2))
 
+	def length_sq(self):
+		return (self.vect.x**2) + (self.vect.y**2)
+
 	def scale_absolute(self, length):
 		scale = float(length) / self.length()
 		point = self.relative_point(scale)
 		return Vector(self.p1, point)
 
+	def scale_absolute_inplace(self, length):
+		'''In place version of scale_absolute, returns self'''
+		return self.scale_relative_inplace(float(length) / self.length())
+
 	def scale_relative(self, ratio):
 		return Vector(self.p1, self.relative_point(ratio))
 
+	def scale_relative_inplace(self, ratio):
+		'''In place version of scale_relative, returns self'''
+		p1 = self.p1
+		x = float(p1.x + ratio * self.vect.x)
+		y = float(p1.y + ratio * self.vect.y)
+		return self.set(p1.x, p1.y, x, y)
+
 	def transform(self, vector):
 		p1 = self.p1.transform(vector)
 		p2 = self.p2.transform(vector)
@@ -75,6 +133,17 @@ class Vector(object):
 
 		return Vector(self.p1, p.transform(self.p1))
 
+	def normal_vector_inplace(self, scale = 1):
+		'''In place version of normal_vector, returns self'''
+		p1 = self.p1
+		x = -(self.p2.y - p1.y)
+		y = self.p2.x - p1.x
+		if scale != 1:
+			x *= scale
+			y *= scale
+
+		return self.set(p1.x, p1.y, x + p1.x, y + p1.y)
+
 	def intersect(self, vector):
 		'''
 			Intersect another vector with this vector
@@ -140,6 +209,32 @@ class Vector(object):
 
 		return points
 
+	def distance_sq(self, point):
+		'''Squared distance of point to the segment from p1 to p2'''
+		vx = self.vect.x
+		vy = self.vect.y
+		fx = self.p1.x - point.x
+		fy = self.p1.y - point.y
+
+		length = vx * vx + vy * vy
+		if length:
+			# The closest point is p1 + t * vect (t clamped to the segment)
+			t = -(fx * vx + fy * vy) / length
+			t = 0.0 if t < 0 else 1.0 if t > 1 else t
+			fx += t * vx
+			fy += t * vy
+		return fx * fx + fy * fy
+
+	def rect_collision(self, center, half_x, half_y):
+		'''
+			Whether the segment from p1 to p2 passes the inside of the axis aligned
+			rectangle around center (the border does not count).
+		'''
+		t_low, t_high = slab(self.p1.x, self.vect.x, center.x - half_x, center.x + half_x, -INF, INF)
+		if t_low < t_high:
+			t_low, t_high = slab(self.p1.y, self.vect.y, center.y - half_y, center.y + half_y, t_low, t_high)
+		return t_low < t_high and t_low < 1 and t_high > 0
+
 	def closest_point(self, point):
 		u = ((point.x - self.p1.x) * (self.p2.x - self.p1.x)) + ((point.y - self.p1.y) * (self.p2.y - self.p1.y))
 		u /= ((self.p2.x - self.p1.x) ** 2 + (self.p2.y - self.p1.y) ** 2)
@@ -0,0 +1,147 @@
+'''
+	The game split into a simulation and a rendering side.
+
+	After every tick the simulation takes an immutable Snapshot of the game (take), the
+	renderer only draws snapshots. With a SimulationThread the game ticks on its own thread
+	and publishes the snapshots to a SnapshotBuffer, the main thread (pygame has to handle
+	the window and the events there) draws the newest one and updates the InputState the
+	simulation samples every tick.
+'''
+import threading
+from collections import deque, namedtuple
+from time import perf_counter
+
+from engine import Boost, CircularObstacle, LEFT, RIGHT, PUMP, BRAKE, TICK_RATE
+
+
+# serial: the number of the obstacle (engine.SERIALS), key: the (category, name) of the image
+# or the image itself, width: the sprite width
+# dx, dy: the movement on the screen during the last tick (for the interpolation)
+ObstacleState = namedtuple('ObstacleState', 'serial key rotation width boost x y dx dy')
+
+# alpha: the fading of the text, dx, dy: its movement during the last tick
+TextState = namedtuple('TextState', 'text x y dx dy font size color alpha')
+
+# tick: the number of ticks, time: when the tick was due (perf_counter, see SimulationThread)
+# x, y: the board position (y along the street), dx, dy: its movement during the last tick
+# angle: of the board, player: the lean vector (x, y), trail: the last board positions
+Snapshot = namedtuple('Snapshot', 'tick time x y dx dy angle player speed max_speed pump_blocked pump '
+	'obstacles trail texts next_checkpoint time_left')
+
+
+def take(game, time = 0.0):
+	'''A Snapshot of the game after its last tick'''
+	board = game.board
+	speed_y = game.sweep.y
+
+	obstacles = []
+	append = obstacles.append
+	for o in game.obstacles:
+		position = o.position
+		if type(o) == CircularObstacle:
+			append(ObstacleState(o.serial, o.key or o.img, o.rotation, o.radius * 2, False, position.x, position.y, 0.0, -speed_y))
+		else:
+			moving = o.moving
+			append(ObstacleState(o.serial, o.key or o.img, o.rotation, o.size[0], type(o) == Boost,
+				position.x, position.y, moving.x, moving.y - speed_y))
+
+	texts = []
+	for t in game.texts:
+		movement = t.movement if t.frames_left else None
+		texts.append(TextState(t.text, t.position.x, t.position.y, movement.x if movement else 0.0,
+			movement.y if movement else 0.0, t.font, t.size, t.color, t.get_alpha()))
+
+	player = board.player_vector_view().vect
+	return Snapshot(game.ticks, time, board.position.x, board.position.y, game.sweep.x, speed_y,
+		board.board_vector_view().angle(), (player.x, player.y), board.speed(), board.max_speed,
+		board.pump_blocked, board.pump_efficiency(), tuple(obstacles), tuple(game.trail), tuple(texts),
+		game.next_checkpoint, game.time_checkpoint + game.last_checkpoint - game.clock.now())
+
+
+class SnapshotBuffer(object):
+	def __init__(self, size = 3):
+		'''The last size snapshots (a triple buffer by default), the oldest are dropped'''
+		self.snapshots = deque(maxlen = size)
+		self.lock = threading.Lock()
+
+	def publish(self, snapshot):
+		with self.lock:
+			self.snapshots.append(snapshot)
+
+	def latest(self):
+		'''The newest snapshot (None before the first one)'''
+		with self.lock:
+			return self.snapshots[-1] if self.snapshots else None
+
+
+class InputState(object):
+	def __init__(self):
+		'''
+			The input of the player, set by the thread handling the events and sampled by the
+			simulation once per tick. A pump press is kept until it was sampled.
+		'''
+		self.lock = threading.Lock()
+		self.held = 0
+		self.pumped = 0
+
+	def set_held(self, left, right, brake):
+		flags = 0
+		if left:
+			flags |= LEFT
+		if right:
+			flags |= RIGHT
+		if brake:
+			flags |= BRAKE
+		self.held = flags
+
+	def pump(self):
+		with self.lock:
+			self.pumped = PUMP
+
+	def sample(self):
+		'''The input flags of the next tick'''
+		with self.lock:
+			flags = self.held | self.pumped
+			self.pumped = 0
+		return flags
+
+
+class SimulationThread(threading.Thread):
+	def __init__(self, game, inputs, buffer, tick_rate = TICK_RATE, max_catch_up = 5):
+		'''
+			Ticks the game tick_rate times per second and publishes a snapshot after every tick.
+			When it is more than max_catch_up ticks behind (e.g. the process was suspended),
+			the missed ticks are dropped.
+		'''
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.game = game
+		self.inputs = inputs
+		self.buffer = buffer
+		self.tick_time = 1.0 / tick_rate
+		self.max_catch_up = max_catch_up
+		self.stopped = threading.Event()
+
+		buffer.publish(take(game, perf_counter()))
+
+	def run(self):
+		game = self.game
+		tick_time = self.tick_time
+		due = perf_counter() + tick_time
+
+		while not self.stopped.is_set():
+			now = perf_counter()
+			if now < due:
+				self.stopped.wait(due - now)
+				continue
+			if now - due > self.max_catch_up * tick_time:
+				due = now
+
+			game.apply_input(self.inputs.sample())
+			game.on_tick()
+			self.buffer.publish(take(game, due))
+			due += tick_time
+
+	def stop(self):
+		self.stopped.set()
+		self.join()
@@ -0,0 +1,125 @@
+import json
+from collections import OrderedDict, deque
+from time import perf_counter
+
+
+class NullProfiler(object):
+	'''
+		Does nothing, used when profiling is disabled.
+	'''
+	enabled = False
+
+	def mark(self, phase):
+		pass
+
+	def end_frame(self):
+		pass
+
+
+class FrameProfiler(object):
+	def __init__(self, window = 240, trace = False):
+		'''
+			Measures the phases of each frame with perf_counter.
+
+			The frame is split by mark(phase): a phase lasts until the next mark or end_frame.
+			The last window frames of every phase are kept for the rolling percentiles.
+			If trace is set, the timings of all frames are kept for export.
+		'''
+		self.enabled = True
+		self.window = window
+		self.phases = OrderedDict()
+		# The timings of the last window frames (phases not marked in a frame are missing)
+		self.recent = deque(maxlen = window)
+		self.frames = 0
+		self.trace = [] if trace else None
+
+		self.phase = None
+		self.started = None
+		self.frame_start = None
+		self.current = {}
+
+	def mark(self, phase):
+		now = perf_counter()
+		if self.phase is not None:
+			self.current[self.phase] = self.current.get(self.phase, 0.0) + now - self.started
+		else:
+			self.frame_start = now
+
+		self.phase = phase
+		self.started = now
+
+	def end_frame(self):
+		if self.phase is None:
+			return
+
+		now = perf_counter()
+		current = self.current
+		current[self.phase] = current.get(self.phase, 0.0) + now - self.started
+		current['total'] = now - self.frame_start
+
+		for phase, duration in current.items():
+			times = self.phases.get(phase)
+			if times is None:
+				times = self.phases[phase] = deque(maxlen = self.window)
+			times.append(duration)
+
+		self.recent.append(current)
+		if self.trace is not None:
+			self.trace.append(current)
+
+		self.frames += 1
+		self.current = {}
+		self.phase = None
+
+	def percentiles(self, percentiles = (50, 95, 99)):
+		'''Returns {phase: [p50, p95, p99]} in seconds over the last window frames'''
+		result = OrderedDict()
+		for phase, times in self.phases.items():
+			times = sorted(times)
+			last = len(times) - 1
+			result[phase] = [times[int(round(last * p / 100.0))] for p in percentiles]
+		return result
+
+	def export(self, filename):
+		'''
+			Write the trace (or the rolling window if there is no trace)
+			as csv or json (chosen by the extension).
+		'''
+		phases = list(self.phases.keys())
+		frames = self.trace if self.trace is not None else self.recent
+
+		if filename.endswith('.json'):
+			data = {'phases': phases, 'percentiles': self.percentiles(),
+				'frames': [[f.get(p, 0.0) for p in phases] for f in frames]}
+			with open(filename, 'w') as f:
+				json.dump(data, f)
+		else:
+			with open(filename, 'w') as f:
+				f.write(','.join(['n'] + phases) + '\n')
+				for i, frame in enumerate(frames):
+					f.write(','.join([str(i)] + ['{:.7f}'.format(frame.get(p, 0.0)) for p in phases]) + '\n')
+
+
+class ProfilerOverlay(object):
+	def __init__(self, profiler, update = 20):
+		'''
+			Draws the percentiles of a FrameProfiler in ms, recalculated every update frames.
+		'''
+		self.profiler = profiler
+		self.update = update
+		self.lines = []
+		self.last = -update
+
+	def draw(self, renderer, position = (10, 80)):
+		profiler = self.profiler
+		if profiler.frames - self.last >= self.update:
+			self.last = profiler.frames
+			self.lines = ['phase  p50  p95  p99 (ms)']
+			for phase, values in profiler.percentiles().items():
+				self.lines.append('{} {}'.format(phase, ' '.join('{:.2f}'.format(v * 1000) for v in values)))
+
+		x, y = position
+		for line in self.lines:
+			label = renderer.texts.render(line, 'courier', 16, (245, 245, 20))
+			renderer.draw_overlay(label, (x, y))
+			y += 16
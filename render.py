@@ -0,0 +1,373 @@
+import pygame
+from collections import OrderedDict
+
+from geometry import Point
+from profiler import NullProfiler
+
+# Road markings: one every MARKING_PERIOD units, MARKING_LENGTH long
+MARKING_PERIOD = 220
+MARKING_LENGTH = 80
+
+
+class SpriteCache(object):
+	def __init__(self, max_bytes = 32 * 1024 * 1024, angle_step = 1):
+		'''
+			LRU cache of rotozoomed images.
+			Sprites are keyed by (image, rotation, width) with the rotation quantized to angle_step
+			degrees and the width to whole pixels. Least recently used sprites are dropped when
+			the cached surfaces take more than max_bytes.
+		'''
+		self.max_bytes = max_bytes
+		self.angle_step = angle_step
+
+		self.sprites = OrderedDict()
+		self.bytes = 0
+
+	def key(self, image, rotation = 0, size_x = 10):
+		rotation = int(round(float(rotation) / self.angle_step)) * self.angle_step % 360
+		return image, rotation, max(1, int(round(size_x)))
+
+	def get(self, image, rotation = 0, size_x = 10):
+		key = self.key(image, rotation, size_x)
+		sprite = self.sprites.get(key)
+		if sprite is not None:
+			self.sprites.move_to_end(key)
+			return sprite
+
+		_, rotation, width = key
+		scale = float(width) / image.get_size()[0]
+		sprite = pygame.transform.rotozoom(image, rotation, scale)
+
+		self.sprites[key] = sprite
+		self.bytes += self.surface_bytes(sprite)
+
+		while self.bytes > self.max_bytes and len(self.sprites) > 1:
+			_, old = self.sprites.popitem(last = False)
+			self.bytes -= self.surface_bytes(old)
+
+		return sprite
+
+	def surface_bytes(self, surface):
+		w, h = surface.get_size()
+		return w * h * surface.get_bytesize()
+
+
+class RotationAtlas(object):
+	def __init__(self, image, size_x, angle_step = 2):
+		'''
+			All rotations of an image (scaled to width size_x) in fixed angle_step degree steps,
+			for sprites whose angle changes every frame (the board).
+		'''
+		self.angle_step = angle_step
+		scale = float(size_x) / image.get_size()[0]
+
+		steps = int(round(360.0 / angle_step))
+		self.sprites = [pygame.transform.rotozoom(image, i * angle_step, scale) for i in range(steps)]
+
+	def get(self, rotation):
+		i = int(round(float(rotation) / self.angle_step))
+		return self.sprites[i % len(self.sprites)]
+
+
+class TextCache(object):
+	def __init__(self, max_labels = 256):
+		'''
+			Caches the font objects by (name, size) and the rendered labels by
+			(text, font, size, color), the labels are least recently used evicted.
+		'''
+		self.max_labels = max_labels
+		self.fonts = {}
+		self.labels = OrderedDict()
+
+	def font(self, name, size):
+		key = (name, size)
+		font = self.fonts.get(key)
+		if font is None:
+			font = self.fonts[key] = pygame.font.SysFont(name, size)
+		return font
+
+	def render(self, text, font = 'helvetica', size = 30, color = (250, 240, 245), alpha = 255):
+		'''
+			Returns the rendered label. Fading labels share the surface rendered
+			at full intensity, only the alpha is changed.
+		'''
+		key = (text, font, size, color)
+		label = self.labels.get(key)
+		if label is None:
+			label = self.font(font, size).render(text, True, color)
+			self.labels[key] = label
+			if len(self.labels) > self.max_labels:
+				self.labels.popitem(last = False)
+		else:
+			self.labels.move_to_end(key)
+
+		label.set_alpha(alpha)
+		return label
+
+
+class RoadLayer(object):
+	def __init__(self, size, border_size, road_color, border_color, marking_color):
+		'''
+			The street (background, borders and markings) drawn once onto a strip which is
+			one marking period taller than the window. Every frame it is blitted with the
+			scroll offset instead of drawing the street again.
+		'''
+		width, height = size
+		middle = width / 2
+
+		self.surface = pygame.Surface((width, height + MARKING_PERIOD))
+		if pygame.display.get_surface():
+			self.surface = self.surface.convert()
+
+		self.surface.fill(road_color)
+		pygame.draw.rect(self.surface, border_color, pygame.Rect(0, 0, border_size, height + MARKING_PERIOD))
+		pygame.draw.rect(self.surface, border_color, pygame.Rect(width - border_size, 0, border_size, height + MARKING_PERIOD))
+
+		for y in range(0, height + MARKING_PERIOD, MARKING_PERIOD):
+			pygame.draw.line(self.surface, marking_color, (middle, y), (middle, y + MARKING_LENGTH), 10)
+
+	def offset(self, position):
+		'''position is the board y (the markings are at the multiples of MARKING_PERIOD - position)'''
+		return int(position) % MARKING_PERIOD
+
+	def draw(self, window, position):
+		window.blit(self.surface, (0, -self.offset(position)))
+
+	def restore(self, window, position, rects):
+		'''Draws the street only in rects (of the window)'''
+		offset = self.offset(position)
+		window.blits([(self.surface, r, r.move(0, offset)) for r in rects], False)
+
+
+class Renderer(object):
+	def __init__(self, window, general_params, images, profiler = None):
+		'''
+			Draws frames of a game onto window (any surface, e.g. the display).
+			general_params are the set up general parameters of the game (see engine.setup_parameters).
+			profiler (a profiler.FrameProfiler) gets a mark for every drawing phase.
+		'''
+		self.window = window
+		self.profiler = profiler if profiler is not None else NullProfiler()
+		self.general = general_params
+		self.images = images
+
+		self.game_size = general_params['size']
+		self.border_size = general_params['border_size']
+		self.start_pos = general_params['start_pos']
+
+		# transpose vector (because of border):
+		self.t_vect = Point(self.border_size, 0)
+		# Reused for the interpolated positions (draw_sprite does not keep the point)
+		self.at = Point(0, 0)
+		# The sprites of the obstacles by their serial: rotation and size of an obstacle never
+		# change, so its sprite is taken from the cache once (only the drawn obstacles are kept)
+		self.obstacle_sprites = {}
+
+		# colors
+		self.white = pygame.Color(245, 245, 245)
+		self.brown = pygame.Color(133, 60, 8)
+		self.black = pygame.Color(5, 8, 7)
+		self.red = pygame.Color(255, 30, 30)
+		self.green = pygame.Color(28, 100, 22)
+		self.bright_green = pygame.Color(20, 245, 18)
+		self.blue = pygame.Color(5, 10, 145)
+
+		# Rotozoomed images (the board has all its rotations prerendered)
+		self.sprites = SpriteCache(int(general_params.get('sprite_cache_mb', 32) * 1024 * 1024))
+		self.board_atlas = RotationAtlas(images['boards']['standard'], 75)
+		self.texts = TextCache()
+
+		self.road = RoadLayer(self.game_size, self.border_size, self.black, self.green, self.white)
+
+		# Sprites and labels are queued and drawn with one Surface.blits call (see flush).
+		# With dirty_rects (general parameter, default on) only the parts of the window drawn
+		# in the last frame and the markings are restored, and only the changed rects are
+		# updated on the display (see changed). Once the drawn area is larger than a third of
+		# the window restoring it costs more than a full redraw.
+		self.dirty_rects = general_params.get('dirty_rects', True)
+		self.queue = []
+		self.dirty = []
+		self.updated = None
+		self.full = True
+		middle = self.game_size[0] // 2
+		self.markings_rect = pygame.Rect(middle - 6, 0, 12, self.game_size[1])
+		self.max_dirty = self.game_size[0] * self.game_size[1] // 3
+
+	# Some drawing helpers
+	def flush(self):
+		'''Draws the queued surfaces, has to be called before drawing anything else'''
+		if self.queue:
+			self.dirty.extend(self.window.blits(self.queue))
+			self.queue = []
+
+	def mark_dirty(self, rect):
+		self.dirty.append(rect)
+
+	def draw_overlay(self, surface, position):
+		'''Blits a surface after draw (e.g. the profiler overlay), it is part of the changed rects'''
+		rect = self.window.blit(surface, position)
+		self.dirty.append(rect)
+		if self.updated is not None:
+			self.updated.append(rect)
+
+	def changed(self):
+		'''The rects changed by the last frame for pygame.display.update (None: all of it)'''
+		return self.updated
+
+	def draw_sprite(self, sprite, point):
+		#get the rect of the sprite and set it's center to the point
+		rotRect = sprite.get_rect()
+		rotRect.center = (point.x + self.t_vect.x, point.y + self.t_vect.y)
+
+		self.queue.append((sprite, rotRect))
+
+	def draw_image(self, bmp, point, rotation = 0, size_x = 10):
+		self.draw_sprite(self.sprites.get(bmp, rotation, size_x), point)
+
+	def draw_text(self, text, position, font = 'helvetica', size = 30, color = (250,240,245), alpha = 255):
+		label = self.texts.render(text, font, size, tuple(color), alpha)
+
+		# Center on point
+		rect = label.get_rect()
+		rect.center = (position.x, position.y)
+
+		# The label surfaces are cached and only their alpha changes, so they are blitted right away
+		self.flush()
+		self.dirty.append(self.window.blit(label, rect))
+
+	def obstacle_image(self, key):
+		'''The image of an obstacle (key is an image or its (category, name))'''
+		return self.images[key[0]][key[1]] if type(key) == tuple else key
+
+	def draw(self, snapshot, fps = 0, alpha = 1.0):
+		'''
+			Draws a pipeline.Snapshot between the tick before it and its own: alpha 0 is the state
+			before its tick, 1 the snapshot. Everything is moved back by (1 - alpha) of its last movement.
+		'''
+		window = self.window
+		game_size = self.game_size
+		border_size = self.border_size
+		start_pos = self.start_pos
+		t_vect = self.t_vect
+		profiler = self.profiler
+
+		# The movement of the last tick still to come (street relative)
+		back = 1.0 - alpha
+		back_x = back * snapshot.dx
+		back_y = back * snapshot.dy
+		at = self.at
+
+		# Draw Street, Borders and road markings (or only where the last frame drew)
+		profiler.mark('road')
+		position = snapshot.y - back_y
+		last = self.dirty
+		self.dirty = []
+		full = self.full or not self.dirty_rects or sum(r.w * r.h for r in last) > self.max_dirty
+		if full:
+			self.road.draw(window, position)
+		else:
+			self.road.restore(window, position, last + [self.markings_rect])
+
+		# Draw all the obstacles
+		profiler.mark('obstacles')
+		sprites = self.obstacle_sprites
+		for o in snapshot.obstacles:
+			point = at.set(o.x - back * o.dx, o.y - back * o.dy)
+
+			if point.y < game_size[1]:
+				sprite = sprites.get(o.serial)
+				if sprite is None:
+					sprite = sprites[o.serial] = self.sprites.get(self.obstacle_image(o.key), o.rotation, o.width)
+				self.draw_sprite(sprite, point)
+
+			else:
+				if o.boost:
+					img = self.images['signs']['arrow_up_green']
+				else:
+					img = self.images['signs']['arrow_up']
+
+				width = o.width - (o.width * (point.y - game_size[1]) / 500)
+				pos = Point(point.x, game_size[1] - 30)
+				self.draw_image(img, pos, 0, width)
+
+		# Forget the sprites of the obstacles which are gone
+		if len(sprites) > 2 * len(snapshot.obstacles) + 32:
+			self.obstacle_sprites = {o.serial: sprites[o.serial] for o in snapshot.obstacles if o.serial in sprites}
+
+		# Draw the checkpoint line
+		dist_left = snapshot.next_checkpoint - position
+		if dist_left < game_size[1] - start_pos:
+			y = start_pos + dist_left
+			cp = pygame.Rect(border_size, y, game_size[0] - border_size, 5)
+			self.flush()
+			self.mark_dirty(pygame.draw.rect(window, self.blue, cp))
+
+		# Show trail
+		profiler.mark('trail')
+		if len(snapshot.trail) > 1:
+			# One polyline for the whole trail
+			dx = t_vect.x
+			dy = start_pos - position
+			points = [(x + dx, y + dy) for x, y in snapshot.trail]
+			# The last point is the (interpolated) board
+			x, y = points[-1]
+			points[-1] = (x - back_x, y - back_y)
+			self.flush()
+			self.mark_dirty(pygame.draw.lines(window, self.red, False, points, 2))
+
+		# Show board vector
+		profiler.mark('board')
+		x = snapshot.x - back_x
+		self.draw_sprite(self.board_atlas.get(-snapshot.angle), at.set(x, start_pos))
+
+		# And player vector
+		x += t_vect.x
+		y = start_pos + t_vect.y
+		px, py = snapshot.player
+		self.flush()
+		self.mark_dirty(pygame.draw.line(window, self.blue, (x, y), (x + 110 * px, y + 110 * py), 10))
+
+		# Show whether the player can push again
+		if not snapshot.pump_blocked:
+			# A rectangle if pushing is possible
+			pump = snapshot.pump
+			g = 20 + int(235 * pump)
+			height = 10 + int(50 * pump)
+
+			color = pygame.Color(10, g, 10)
+			rect = pygame.Rect(border_size + 10, 10, 10, height)
+			self.mark_dirty(pygame.draw.rect(window, color, rect))
+		else:
+			self.mark_dirty(pygame.draw.circle(window, self.red, (border_size + 20,20), 10, 0))
+
+		# Show current speed and fps
+		profiler.mark('text')
+		speed = snapshot.speed
+		text = str(int(round(2 * speed)))
+		if speed > snapshot.max_speed:
+			c = (245, 10, 10)
+		else:
+			c = (245, 245, 245)
+		self.draw_text(text, Point(border_size + 55, 22), size = 30, color = c)
+
+		# Unlimited frames can be faster than the millisecond resolution of the fps clock
+		fps = str(int(min(fps, 9999))) + ' fps'
+		self.draw_text(fps, Point(game_size[0] - border_size, 20), size = 25)
+
+		# Overlay texts
+		for t in snapshot.texts:
+			point = at.set(t.x - back * t.dx + t_vect.x, t.y - back * t.dy + t_vect.y)
+			self.draw_text(t.text, point, t.font, t.size, t.color, t.alpha)
+
+		# Show time and distance left
+		time_left = round(snapshot.time_left, 1)
+		dist_left = round(float(snapshot.next_checkpoint - position) / 100, 0)
+		self.draw_text(str(time_left) + 's', Point(game_size[0] - border_size, 40), 'helvetica', 25, self.white)
+		self.draw_text(str(dist_left) + 'm', Point(game_size[0] - border_size, 60), 'helvetica', 25, self.white)
+		self.flush()
+
+		if full:
+			self.full = False
+			self.updated = None
+		else:
+			self.updated = last + self.dirty + [self.markings_rect]
@@ -0,0 +1,414 @@
+'''
+	Binary replays of long games, seekable to any tick.
+
+	A ReplayWriter is attached to a Game and records every tick: the input flags and the
+	board state (delta encoded, 8 bytes per tick). Every interval ticks it writes a keyframe
+	with the complete game state (board, obstacles, texts, map cursor, checkpoints and the
+	random states). A ReplayReader memory maps the file: the board track of any tick is
+	read from the deltas of its block, a Game at any tick is restored from the keyframe
+	before it by replaying at most interval ticks.
+
+	File layout (little endian):
+		MAGIC, version, header length, json header {seed, parameters, tick_rate, interval}
+		blocks: a zlib compressed json keyframe at tick T followed by the records of the
+		        ticks T + 1 to the tick of the next keyframe
+		index: one entry per keyframe (tick, offset, length, board x, board y)
+		footer: index offset, number of entries, number of ticks, MAGIC
+
+	python replay.py record OUT TICKS [SEED]   records engine.example_parameters (weave_policy)
+	python replay.py info FILE
+	python replay.py view FILE [TICK]          LEFT/RIGHT jump a keyframe interval, SPACE pauses
+'''
+import json
+import mmap
+import struct
+import sys
+import zlib
+from bisect import bisect_left, bisect_right
+
+import engine
+from clock import TickClock
+from engine import Boost, CircularObstacle, FloatingText, Game, Rectangular
+from geometry import Point
+
+
+VERSION = 1
+MAGIC = b'SLRP'
+
+HEADER = struct.Struct('<HI')
+# flags, hit, dx and dy (in 1/POSITION_SCALE pixels), lean (per max_lean, LEAN_SCALE)
+RECORD = struct.Struct('<BBhhh')
+# tick, keyframe offset, keyframe length, board x and y at the keyframe
+ENTRY = struct.Struct('<IQIdd')
+# index offset, number of entries, number of ticks
+FOOTER = struct.Struct('<QII4s')
+
+POSITION_SCALE = 256.0
+LEAN_SCALE = 32000.0
+HITS = (None, 'wall', 'pothole', 'boost', 'car')
+KINDS = {CircularObstacle: 'pothole', Rectangular: 'car', Boost: 'boost'}
+
+
+def clamp16(value):
+	return max(-32767, min(32767, int(round(value))))
+
+
+def random_state(rng):
+	version, internal, gauss = rng.getstate()
+	return [version, list(internal), gauss]
+
+
+def set_random_state(rng, state):
+	version, internal, gauss = state
+	rng.setstate((version, tuple(internal), gauss))
+
+
+## Keyframes
+def keyframe(game):
+	'''The complete state of a game between two ticks as json data'''
+	board = game.board
+	obstacles = game.obstacles
+
+	items = []
+	for o in obstacles:
+		category, name = o.key
+		if type(o) == CircularObstacle:
+			items.append(['pothole', o.position.x, o.position.y, o.rotation, o.radius, o.speed, category, name])
+		else:
+			items.append([KINDS[type(o)], o.position.x, o.position.y, o.rotation, list(o.size),
+				getattr(o, 'speed', 0), category, name, o.moving.x, o.moving.y])
+
+	on = obstacles.index(board.currently_on) if board.currently_on else None
+	texts = [[t.text, t.position.x, t.position.y, list(t.color), t.frames_left, t.fading, t.movement.x, t.movement.y,
+		t.font, t.size, t.intensity] for t in game.texts]
+
+	return {
+		'ticks': game.ticks,
+		'clock': getattr(game.clock, 'ticks', game.ticks),
+		'random': random_state(game.random),
+		'board': [board.position.x, board.position.y, board.direction.x, board.direction.y, board.player,
+			board.pump_blocked, on],
+		'obstacles': items,
+		'grid': [game.grid.reach, game.grid.moving_reach] if game.grid is not None else None,
+		'texts': texts,
+		'trail': list(game.trail),
+		'map': game.map_cursor.index,
+		# The last checkpoint relative to the game time, so it fits any clock on restore
+		'checkpoints': [game.dist_checkpoint, game.time_checkpoint, game.num_checkpoint, game.next_checkpoint,
+			game.last_checkpoint - game.clock.now()],
+		'last_milestone': game.last_milestone,
+		'last_slot': game.last_slot,
+		'speed_warning': game.speed_warning,
+		'game_over': game.game_over,
+		'last_hit': game.last_hit,
+		'sweep': [game.sweep.x, game.sweep.y],
+		'spawns': game.spawns.state(),
+		}
+
+
+def restore(game, state):
+	'''Sets a game (of the same parameters and seed) to a keyframe'''
+	game.ticks = state['ticks']
+	if isinstance(game.clock, TickClock):
+		game.clock.ticks = state['clock']
+	set_random_state(game.random, state['random'])
+
+	game.map_cursor.index = state['map']
+	game.map_cursor.next_distance = game.timeline.distance(state['map'] + 1)
+	game.set_parameters(game.map_cursor.element)
+
+	game.clear_obstacles()
+	images = game.images
+	for item in state['obstacles']:
+		kind, x, y, rotation, size, speed, category, name = item[:8]
+		image = images[category][name]
+		if kind == 'pothole':
+			obstacle = CircularObstacle(Point(x, y), rotation, size, image, speed, (category, name))
+		else:
+			moving = Point(item[8], item[9])
+			if kind == 'boost':
+				obstacle = Boost(Point(x, y), moving, rotation, image, size[0], speed, (category, name))
+			else:
+				obstacle = Rectangular(Point(x, y), moving, rotation, image, size[0], (category, name))
+			obstacle.size = list(size)
+		game.add_obstacle(obstacle)
+	if state['grid'] is not None and game.grid is not None:
+		game.grid.reach, game.grid.moving_reach = state['grid']
+
+	board = game.board
+	x, y, dx, dy, player, pump_blocked, on = state['board']
+	board.position.set(x, y)
+	board.direction = Point(dx, dy)
+	board.player = player
+	board.pump_blocked = pump_blocked
+	board.currently_on = game.obstacles[on] if on is not None else False
+
+	game.texts = []
+	for text, x, y, color, frames_left, fading, mx, my, font, size, intensity in state['texts']:
+		t = FloatingText(text, Point(x, y), tuple(color), frames_left, fading, font, size, Point(mx, my))
+		t.intensity = intensity
+		game.texts.append(t)
+
+	game.trail.clear()
+	game.trail.extend(tuple(p) for p in state['trail'])
+
+	(game.dist_checkpoint, game.time_checkpoint, game.num_checkpoint, game.next_checkpoint,
+		last_checkpoint) = state['checkpoints']
+	game.last_checkpoint = game.clock.now() + last_checkpoint
+	game.last_milestone = state['last_milestone']
+	game.last_slot = state['last_slot']
+	game.speed_warning = state['speed_warning']
+	game.game_over = state['game_over']
+	game.last_hit = state['last_hit']
+	game.sweep.set(*state['sweep'])
+	game.spawns.set_state(state['spawns'])
+
+
+## Writing
+def json_parameters(parameters):
+	'''The set up game parameters with str keys (json)'''
+	parameters = dict(parameters)
+	parameters['elements'] = {str(k): v for k, v in parameters['elements'].items()}
+	return parameters
+
+
+class ReplayWriter(object):
+	def __init__(self, filename, game, interval = 400):
+		'''
+			Records game from its current tick on (it is called by Game.on_tick), with a
+			keyframe every interval ticks. close writes the index, a replay without it can
+			not be read.
+		'''
+		self.game = game
+		self.interval = interval
+		self.max_lean = float(game.board.max_lean)
+		self.index = []
+
+		header = json.dumps({'seed': game.seed, 'parameters': json_parameters(game.parameters),
+			'tick_rate': getattr(game.clock, 'tick_rate', engine.TICK_RATE), 'interval': interval}).encode('utf-8')
+		self.file = open(filename, 'wb')
+		self.file.write(MAGIC)
+		self.file.write(HEADER.pack(VERSION, len(header)))
+		self.file.write(header)
+
+		self.write_keyframe(game)
+		game.replay = self
+
+	def write_keyframe(self, game):
+		data = zlib.compress(json.dumps(keyframe(game)).encode('utf-8'))
+		position = game.board.position
+		self.index.append(ENTRY.pack(game.ticks, self.file.tell(), len(data), position.x, position.y))
+		self.file.write(data)
+
+		# The deltas are taken from the decoded positions, so the rounding errors do not add up
+		self.x = position.x
+		self.y = position.y
+		self.ticks = game.ticks
+
+	def record(self, game, flags):
+		board = game.board
+		dx = clamp16((board.position.x - self.x) * POSITION_SCALE)
+		dy = clamp16((board.position.y - self.y) * POSITION_SCALE)
+		self.x += dx / POSITION_SCALE
+		self.y += dy / POSITION_SCALE
+		lean = clamp16(board.player / self.max_lean * LEAN_SCALE)
+
+		self.file.write(RECORD.pack(flags, HITS.index(game.last_hit), dx, dy, lean))
+		self.ticks = game.ticks
+		if game.ticks % self.interval == 0:
+			self.write_keyframe(game)
+
+	def close(self):
+		if self.file is None:
+			return
+		offset = self.file.tell()
+		for entry in self.index:
+			self.file.write(entry)
+		self.file.write(FOOTER.pack(offset, len(self.index), self.ticks, MAGIC))
+		self.file.close()
+		self.file = None
+		if self.game.replay is self:
+			self.game.replay = None
+
+
+## Reading
+class ReplayReader(object):
+	def __init__(self, filename):
+		'''
+			A memory mapped replay, only the header and the index are read.
+			Ticks are counted like Game.ticks: tick n is the state after n on_tick calls.
+		'''
+		self.file = open(filename, 'rb')
+		self.data = data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+
+		if data[:4] != MAGIC:
+			raise ValueError('{} is not a replay'.format(filename))
+		version, length = HEADER.unpack_from(data, 4)
+		if version > VERSION:
+			raise ValueError('replay version {} is newer than {}'.format(version, VERSION))
+		header = json.loads(data[4 + HEADER.size:4 + HEADER.size + length].decode('utf-8'))
+
+		offset, count, self.ticks, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+		if magic != MAGIC:
+			raise ValueError('{} has no index (the writer was not closed)'.format(filename))
+		self.index = [ENTRY.unpack_from(data, offset + i * ENTRY.size) for i in range(count)]
+		self.keyframe_ticks = [e[0] for e in self.index]
+
+		self.seed = header['seed']
+		self.tick_rate = header['tick_rate']
+		self.interval = header['interval']
+		parameters = header['parameters']
+		parameters['elements'] = {int(k): v for k, v in parameters['elements'].items()}
+		self.parameters = parameters
+		# The restored games generate their obstacles without a thread (it would only be stopped
+		# again, see restore)
+		self.game_parameters = dict(parameters, general = dict(parameters['general'], spawn_thread = False))
+		self.max_lean = float(parameters['board']['max_lean'])
+
+	def __len__(self):
+		return self.ticks
+
+	def close(self):
+		self.data.close()
+		self.file.close()
+
+	@property
+	def first(self):
+		'''The first recorded tick'''
+		return self.keyframe_ticks[0]
+
+	def check(self, tick):
+		if not self.first <= tick <= self.ticks:
+			raise IndexError('tick {} is not in {} to {}'.format(tick, self.first, self.ticks))
+
+	def keyframe(self, i):
+		_, offset, length, _, _ = self.index[i]
+		return json.loads(zlib.decompress(self.data[offset:offset + length]).decode('utf-8'))
+
+	def records(self, start, stop):
+		'''The records (flags, hit, dx, dy, lean) of the ticks start + 1 to stop (in one block)'''
+		i = bisect_left(self.keyframe_ticks, start + 1) - 1
+		tick, offset, length, _, _ = self.index[i]
+		offset += length + (start - tick) * RECORD.size
+		return RECORD.iter_unpack(self.data[offset:offset + (stop - start) * RECORD.size])
+
+	def inputs(self, start, stop):
+		'''The input flags of the ticks start + 1 to stop'''
+		flags = bytearray()
+		while start < stop:
+			# Up to the end of the block
+			i = bisect_right(self.keyframe_ticks, start)
+			end = min(stop, self.keyframe_ticks[i]) if i < len(self.index) else stop
+			flags.extend(r[0] for r in self.records(start, end))
+			start = end
+		return flags
+
+	def board(self, tick):
+		'''(x, y, lean, hit) of the board at a tick, from the keyframe before it and the deltas'''
+		self.check(tick)
+		i = bisect_right(self.keyframe_ticks, tick) - 1
+		start, _, _, x, y = self.index[i]
+		if start == tick:
+			state = self.keyframe(i)
+			return x, y, state['board'][4], state['last_hit']
+
+		dx = dy = 0
+		for _, hit, rx, ry, lean in self.records(start, tick):
+			dx += rx
+			dy += ry
+		return x + dx / POSITION_SCALE, y + dy / POSITION_SCALE, lean / LEAN_SCALE * self.max_lean, HITS[hit]
+
+	def game(self, tick, images = None):
+		'''
+			A Game at tick (default images: the headless engine.headers), restored from the
+			keyframe before it. Its recorder only holds the inputs from there on.
+		'''
+		self.check(tick)
+		i = bisect_right(self.keyframe_ticks, tick) - 1
+		game = Game(self.game_parameters, images if images is not None else engine.headers,
+			clock = TickClock(self.tick_rate), seed = self.seed)
+		restore(game, self.keyframe(i))
+
+		for flags in self.inputs(self.keyframe_ticks[i], tick):
+			game.apply_input(flags)
+			game.on_tick()
+		return game
+
+
+def record(filename, ticks, seed = 1, interval = 400):
+	'''Records ticks of engine.example_parameters played by engine.weave_policy'''
+	parameters = engine.setup_parameters(engine.example_parameters)
+	game = Game(parameters, engine.headers, seed = seed)
+	writer = ReplayWriter(filename, game, interval)
+	for _ in range(ticks):
+		game.apply_input(engine.weave_policy(game))
+		game.on_tick()
+	writer.close()
+
+
+def view(filename, tick = None):
+	import pygame
+	from pygame.locals import QUIT, KEYDOWN, K_LEFT, K_RIGHT, K_SPACE
+	from render import Renderer
+	from pipeline import take
+
+	reader = ReplayReader(filename)
+	general = reader.parameters['general']
+	pygame.init()
+	window = pygame.display.set_mode(general['size'])
+	pygame.display.set_caption('Slalom Boarding Replay')
+	engine.bmps.convert()
+	renderer = Renderer(window, general, engine.bmps)
+	clock = pygame.time.Clock()
+
+	game = reader.game(reader.first if tick is None else tick)
+	paused = False
+	while True:
+		seek = None
+		for event in pygame.event.get():
+			if event.type == QUIT:
+				pygame.quit()
+				reader.close()
+				return
+			elif event.type == KEYDOWN and event.key == K_SPACE:
+				paused = not paused
+			elif event.type == KEYDOWN and event.key in (K_LEFT, K_RIGHT):
+				step = reader.interval if event.key == K_RIGHT else -reader.interval
+				seek = max(reader.first, min(reader.ticks, game.ticks + step))
+
+		if seek is not None:
+			game = reader.game(seek)
+		elif not paused and game.ticks < reader.ticks:
+			game.apply_input(reader.inputs(game.ticks, game.ticks + 1)[0])
+			game.on_tick()
+
+		renderer.draw(take(game), clock.get_fps())
+		changed = renderer.changed()
+		if changed is None:
+			pygame.display.update()
+		else:
+			pygame.display.update(changed)
+		clock.tick(reader.tick_rate)
+
+
+def main(argv = None):
+	argv = sys.argv[1:] if argv is None else argv
+	if len(argv) in (3, 4) and argv[0] == 'record':
+		record(argv[1], int(argv[2]), int(argv[3]) if len(argv) == 4 else 1)
+	elif len(argv) == 2 and argv[0] == 'info':
+		reader = ReplayReader(argv[1])
+		x, y, _, _ = reader.board(reader.ticks)
+		print('seed {} ticks {} to {} ({} keyframes every {} ticks)'.format(reader.seed, reader.first,
+			reader.ticks, len(reader.index), reader.interval))
+		print('distance {:.1f}m'.format(y / 100.0))
+		reader.close()
+	elif len(argv) in (2, 3) and argv[0] == 'view':
+		view(argv[1], int(argv[2]) if len(argv) == 3 else None)
+	else:
+		print(__doc__)
+		return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
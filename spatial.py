@@ -0,0 +1,91 @@
+import math
+
+
+class ObstacleGrid(object):
+	def __init__(self, cell_size = 100):
+		'''
+			Uniform grid bucketing the obstacles by y.
+
+			The y coordinate is taken relative to the total scrolled distance (position.y + offset),
+			so obstacles which only scroll never change their cell. Just the moving ones
+			(cars) have to be re-bucketed after each tick.
+		'''
+		self.cell_size = float(cell_size)
+		self.offset = 0.0
+
+		# The largest extent of any obstacle seen so far (radius or half size)
+		self.reach = 0.0
+		# The largest y movement per tick of any obstacle seen so far
+		self.moving_reach = 0.0
+
+		self.cells = {}
+		self.entries = {}
+		self.moving = {}
+
+		# Insertion counter: candidates are returned in the order they were added
+		self.count = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def cell(self, y):
+		return int(math.floor((y + self.offset) / self.cell_size))
+
+	def add(self, obstacle):
+		key = id(obstacle)
+		c = self.cell(obstacle.position.y)
+		entry = (self.count, obstacle)
+		self.count += 1
+
+		self.cells.setdefault(c, []).append(entry)
+		self.entries[key] = [c, entry]
+		self.reach = max(self.reach, obstacle.extent())
+
+		moving = getattr(obstacle, 'moving', None)
+		if moving is not None and (moving.x or moving.y):
+			self.moving[key] = obstacle
+			self.moving_reach = max(self.moving_reach, abs(moving.y))
+
+	def remove(self, obstacle):
+		key = id(obstacle)
+		c, entry = self.entries.pop(key)
+		self._discard(c, entry)
+		self.moving.pop(key, None)
+
+	def _discard(self, c, entry):
+		bucket = self.cells[c]
+		bucket.remove(entry)
+		if not bucket:
+			del self.cells[c]
+
+	def scroll(self, speed_y):
+		'''
+			Has to be called after the obstacles have been advanced by speed_y.
+		'''
+		self.offset += speed_y
+
+		for key, obstacle in self.moving.items():
+			item = self.entries[key]
+			c = self.cell(obstacle.position.y)
+			if c != item[0]:
+				self._discard(item[0], item[1])
+				self.cells.setdefault(c, []).append(item[1])
+				item[0] = c
+
+	def query(self, point, reach = 0):
+		'''
+			Returns all obstacles which could contain a point (within reach in y),
+			in the order they were added.
+		'''
+		reach = self.reach + reach + 1
+		lower = self.cell(point.y - reach)
+		upper = self.cell(point.y + reach)
+
+		found = []
+		cells = self.cells
+		for c in range(lower, upper + 1):
+			if c in cells:
+				found.extend(cells[c])
+
+		found.sort(key = lambda e: e[0])
+		return [obstacle for _, obstacle in found]
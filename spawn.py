@@ -0,0 +1,223 @@
+'''
+	The obstacles of a course as a stream of spawn records, generated ahead of the board.
+
+	The game pulls the next spawn slot once the board is more than step_size (of the map
+	element in effect) past the last one, each slot draws a pothole, a forward car,
+	a backwards car and a boost with their probabilities. The records of a slot only
+	depend on the seed, the slot number, the map element and the image names, not on
+	the ride, so they can be generated in batches, on a background thread or baked to a file.
+
+	python spawn.py OUT SLOTS [SEED]   bakes the course of engine.example_parameters
+'''
+import json
+import queue
+import random
+import sys
+import threading
+import zlib
+from collections import deque, namedtuple
+
+from timeline import MapTimeline
+
+
+# slot: the number of the slot
+# y: the screen y at the spawn (forward cars: the position in front)
+# speed: slow down / boost (potholes, boosts) or the y movement (cars)
+# coin: forward cars are placed behind the board if it is not faster and coin >= 0.5
+SpawnRecord = namedtuple('SpawnRecord', 'slot kind x y rotation size speed key coin')
+
+
+class SpawnStream(object):
+	def __init__(self, elements, street_size, images, seed, batch = 64, background = False, ahead = 4):
+		'''
+			elements are the map elements (or a MapTimeline), street_size the general parameter.
+			images: the keys of the potholes, cars and boosts categories are the image names.
+			batch is the number of slots generated at once, for the element the last slot was
+			pulled with. With background a thread generates up to ahead batches in advance.
+		'''
+		self.timeline = MapTimeline.compile(elements)
+		self.size = street_size
+		self.middle = street_size[0] / 2
+		self.keys = {c: sorted(images[c].keys()) for c in ('potholes', 'cars', 'boosts')}
+		self.seed = seed
+		self.batch = batch
+
+		# Every slot has its own random stream (seeded by base + slot)
+		self.base = random.Random(seed).getrandbits(64) << 32
+		self.random = random.Random()
+		# The next slot and the index of the map element of the last one
+		self.slot = 0
+		self.element = 0
+		# (slot, element, records) generated in advance
+		self.pending = deque()
+		# Baked streams: the records by element and slot (see load)
+		self.baked = None
+
+		self.thread = None
+		if background:
+			self.batches = queue.Queue(maxsize = ahead)
+			self.stopped = False
+			self.thread = threading.Thread(target = self.produce, args = (self.slot,))
+			self.thread.daemon = True
+			self.thread.start()
+
+	## Generation
+	def generate(self, slot, element, rng = None):
+		'''The records of a slot with the map element at index element in effect'''
+		rng = rng or self.random
+		rng.seed(self.base + slot)
+		parameters = self.timeline[element]
+
+		records = []
+		self.pothole(rng, records, slot, **parameters['obstacles'])
+		self.car(rng, records, slot, **parameters['forward_cars'])
+		self.car(rng, records, slot, **dict(parameters['backwards_cars'], forward = False))
+		self.boost(rng, records, slot, **parameters['boosts'])
+		return records
+
+	def generate_batch(self, first, element, rng = None):
+		return [(slot, element, self.generate(slot, element, rng)) for slot in range(first, first + self.batch)]
+
+	def pothole(self, rng, records, slot, probability = 0.01, size = (3, 20), speed = (50, 80)):
+		if rng.random() < probability:
+			# Not in the middle or too far outside
+			x = rng.randrange(30, (self.size[0] // 2) - 20)
+			x = self.middle - x if rng.random() > 0.5 else self.middle + x
+
+			radius = rng.randrange(size[0], size[1] + 1)
+			rotation = rng.randrange(0, 360)
+			speed = rng.randrange(speed[0], speed[1] + 1)
+			key = rng.choice(self.keys['potholes'])
+			records.append(SpawnRecord(slot, 'pothole', x, self.size[1] + 500, rotation, radius, speed, key, None))
+
+	def car(self, rng, records, slot, probability = 0.01, size = (20, 25), moving = (10, 14), forward = True):
+		if rng.random() < probability:
+			x = rng.randrange(50, (self.size[0] // 2) - 50)
+			speed = rng.randrange(moving[0], moving[1])
+			key = rng.choice(self.keys['cars'])
+			width = rng.randrange(size[0], size[1])
+
+			if forward:
+				records.append(SpawnRecord(slot, 'car', self.middle - x, self.size[1] + 300, 90, width, speed, key, rng.random()))
+			else:
+				records.append(SpawnRecord(slot, 'car', self.middle + x, self.size[1] + 300, 270, width, -speed, key, None))
+
+	def boost(self, rng, records, slot, probability = 0.01, size = (40, 60), speed = (30, 40)):
+		if rng.random() < probability:
+			x = rng.randrange(0, self.size[0])
+			width = rng.randrange(size[0], size[1])
+			speed = rng.randrange(speed[0], speed[1])
+			key = rng.choice(self.keys['boosts'])
+			records.append(SpawnRecord(slot, 'boost', x, self.size[1] + 500, 180, width, speed, key, None))
+
+	def produce(self, slot):
+		# The thread has its own random stream, mismatched slots are generated again by next_slot
+		rng = random.Random()
+		while not self.stopped:
+			batch = self.generate_batch(slot, self.element, rng)
+			slot += self.batch
+			while not self.stopped:
+				try:
+					self.batches.put(batch, timeout = 0.1)
+					break
+				except queue.Full:
+					pass
+
+	def next_batch(self, slot):
+		while self.thread is not None:
+			try:
+				return self.batches.get(timeout = 0.1)
+			except queue.Empty:
+				if not self.thread.is_alive():
+					# The producer failed (the error was reported by the thread), the batches
+					# before slot were all taken: go on here, which raises the error again
+					self.thread = None
+		return self.generate_batch(slot, self.element)
+
+	## Consuming
+	def next_slot(self, element):
+		'''The records of the next slot, element is the index of the map element in effect'''
+		slot = self.slot
+		self.slot += 1
+		self.element = element
+
+		if self.baked is not None:
+			if element >= len(self.baked):
+				return []
+			return self.baked[element].get(slot, [])
+
+		pending = self.pending
+		if not pending:
+			pending.extend(self.next_batch(slot))
+		_, generated, records = pending.popleft()
+		if generated != element:
+			# Generated in advance for the element before
+			records = self.generate(slot, element)
+		return records
+
+	def close(self):
+		if self.thread is not None:
+			self.stopped = True
+			self.thread.join()
+			self.thread = None
+
+	## State (for replay keyframes)
+	def state(self):
+		'''The state of the stream as json data (the slots only depend on their number)'''
+		return {'slot': self.slot}
+
+	def set_state(self, state):
+		'''Continues from a state, a background thread is stopped'''
+		self.close()
+		self.slot = state['slot']
+		self.pending.clear()
+
+	## Baking
+	def bake(self, filename, slots):
+		'''Writes the records of the first slots (for every map element) to a file, see load'''
+		records = []
+		for element in range(len(self.timeline)):
+			records.append([list(r) for slot in range(slots) for r in self.generate(slot, element)])
+
+		data = {'seed': self.seed, 'slots': slots, 'records': records}
+		with open(filename, 'wb') as f:
+			f.write(zlib.compress(json.dumps(data).encode('utf-8')))
+
+	@classmethod
+	def load(cls, filename):
+		'''A stream of the baked records, the slots after them are empty'''
+		with open(filename, 'rb') as f:
+			data = json.loads(zlib.decompress(f.read()).decode('utf-8'))
+
+		stream = cls.__new__(cls)
+		stream.seed = data['seed']
+		stream.thread = None
+		stream.slot = 0
+		stream.element = 0
+		stream.pending = deque()
+		stream.baked = []
+		for rows in data['records']:
+			slots = {}
+			for r in rows:
+				record = SpawnRecord(*r)
+				slots.setdefault(record.slot, []).append(record)
+			stream.baked.append(slots)
+		return stream
+
+
+def main(argv = None):
+	argv = sys.argv[1:] if argv is None else argv
+	if len(argv) not in (2, 3):
+		print(__doc__)
+		return 1
+
+	import engine
+	parameters = engine.setup_parameters(engine.example_parameters)
+	seed = int(argv[2]) if len(argv) == 3 else 1
+	stream = SpawnStream(parameters['elements'], parameters['general']['street_size'], engine.headers, seed)
+	stream.bake(argv[0], int(argv[1]))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
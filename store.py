@@ -0,0 +1,208 @@
+import numpy as np
+
+
+CIRCLE, RECTANGLE, BOOST = 0, 1, 2
+
+
+class SlotPoint(object):
+	'''
+		The position of an obstacle in an ObstacleStore, reads and writes go to the columns.
+	'''
+	__slots__ = ('store', 'slot')
+
+	def __init__(self, store, slot):
+		self.store = store
+		self.slot = slot
+
+	@property
+	def x(self):
+		return float(self.store.x[self.slot])
+
+	@x.setter
+	def x(self, value):
+		self.store.x[self.slot] = value
+
+	@property
+	def y(self):
+		return float(self.store.y[self.slot])
+
+	@y.setter
+	def y(self, value):
+		self.store.y[self.slot] = value
+
+	def __repr__(self):
+		return 'SlotPoint({}, {})'.format(self.x, self.y)
+
+
+class ObstacleStore(object):
+	def __init__(self, capacity = 64):
+		'''
+			Obstacles as numpy columns, one slot per obstacle:
+				x, y     position
+				vx, vy   movement per tick (cars)
+				kind     CIRCLE, RECTANGLE or BOOST
+				hx, hy   half extents (the radius in hx for circles)
+				speed    slow down or boost of potholes and boosts
+				image    id of the obstacle key in self.keys
+				order    spawn counter, the first spawned obstacle wins a collision
+
+			Advancing, culling and the collision test are one vectorized operation each.
+			The obstacle objects stay as views: their position is a SlotPoint into the columns.
+			Slots of removed obstacles are reused, so the views never move.
+		'''
+		self.capacity = 0
+		self.used = 0
+		self.free = []
+		self.count = 0
+
+		self.objects = []
+		self.keys = []
+		self.key_ids = {}
+
+		self.grow(capacity)
+
+	def __len__(self):
+		return self.used - len(self.free)
+
+	def grow(self, capacity):
+		def resize(column, dtype, fill = 0):
+			new = np.full(capacity, fill, dtype)
+			if column is not None:
+				new[:self.capacity] = column
+			return new
+
+		for name in ('x', 'y', 'vx', 'vy', 'hx', 'hy', 'speed'):
+			setattr(self, name, resize(getattr(self, name, None), np.float64))
+		self.kind = resize(getattr(self, 'kind', None), np.int8)
+		self.image = resize(getattr(self, 'image', None), np.int32, -1)
+		self.order = resize(getattr(self, 'order', None), np.int64)
+		self.alive = resize(getattr(self, 'alive', None), np.bool_, False)
+
+		self.objects.extend([None] * (capacity - self.capacity))
+		self.capacity = capacity
+
+	def add(self, obstacle):
+		'''Stores an obstacle (CircularObstacle, Rectangular or Boost), its position becomes a SlotPoint'''
+		if self.free:
+			slot = self.free.pop()
+		else:
+			if self.used == self.capacity:
+				self.grow(self.capacity * 2)
+			slot = self.used
+			self.used += 1
+
+		position = obstacle.position
+		self.x[slot] = position.x
+		self.y[slot] = position.y
+
+		if hasattr(obstacle, 'radius'):
+			self.kind[slot] = CIRCLE
+			self.hx[slot] = self.hy[slot] = obstacle.radius
+			self.vx[slot] = self.vy[slot] = 0
+		else:
+			self.kind[slot] = BOOST if hasattr(obstacle, 'speed') else RECTANGLE
+			self.hx[slot] = float(obstacle.size[0]) / 2
+			self.hy[slot] = float(obstacle.size[1]) / 2
+			self.vx[slot] = obstacle.moving.x
+			self.vy[slot] = obstacle.moving.y
+
+		self.speed[slot] = getattr(obstacle, 'speed', 0)
+		self.image[slot] = self.key_id(obstacle.key)
+		self.order[slot] = self.count
+		self.count += 1
+		self.alive[slot] = True
+
+		self.objects[slot] = obstacle
+		obstacle.slot = slot
+		obstacle.position = SlotPoint(self, slot)
+		return slot
+
+	def key_id(self, key):
+		if key is None:
+			return -1
+		i = self.key_ids.get(key)
+		if i is None:
+			i = self.key_ids[key] = len(self.keys)
+			self.keys.append(key)
+		return i
+
+	def advance(self, speed_y, lower, upper):
+		'''
+			Moves all obstacles and scrolls them by speed_y, then removes the ones
+			outside lower <= y <= upper. Returns the removed obstacles.
+		'''
+		n = self.used
+		x, y = self.x[:n], self.y[:n]
+		x += self.vx[:n]
+		y += self.vy[:n]
+		y -= speed_y
+
+		alive = self.alive[:n]
+		dead = np.flatnonzero(alive & ((y < lower) | (y > upper)))
+		if not dead.size:
+			return []
+
+		alive[dead] = False
+		removed = []
+		for slot in dead.tolist():
+			removed.append(self.objects[slot])
+			self.objects[slot] = None
+			self.free.append(slot)
+		return removed
+
+	def first_hit(self, px, py, sx = 0.0, sy = 0.0):
+		'''
+			The first spawned obstacle touched by the board or None.
+			The board moved by (sx, sy) relative to the street and ended at (px, py),
+			the segment it moved along relative to each obstacle is tested (see Game.obstacle_at).
+		'''
+		n = self.used
+		x, y = self.x[:n], self.y[:n]
+		hx, hy = self.hx[:n], self.hy[:n]
+
+		# The segments from (x1, y1) by (dx, dy)
+		x1 = (px - sx) + self.vx[:n]
+		y1 = (py - sy) + self.vy[:n]
+
+		# Only the obstacles whose bounding box overlaps the one of their segment can be hit
+		near = self.alive[:n] & (np.minimum(y1, py) < y + hy) & (np.maximum(y1, py) > y - hy)
+		near &= (np.minimum(x1, px) < x + hx) & (np.maximum(x1, px) > x - hx)
+		near = np.flatnonzero(near)
+		if not near.size:
+			return None
+
+		x, y, hx, hy, x1, y1 = x[near], y[near], hx[near], hy[near], x1[near], y1[near]
+		n = near.size
+		dx = px - x1
+		dy = py - y1
+
+		# Circles: the closest point of the segment
+		fx = x1 - x
+		fy = y1 - y
+		length = dx * dx + dy * dy
+		moved = length > 0
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			t = np.where(moved, -(fx * dx + fy * dy) / length, 0.0)
+		t = np.clip(t, 0.0, 1.0)
+		fx = np.where(moved, fx + t * dx, fx)
+		fy = np.where(moved, fy + t * dy, fy)
+		circle = fx * fx + fy * fy < hx * hx
+
+		# Rectangles: the part of the segment inside both slabs
+		t_low = np.full(n, -np.inf)
+		t_high = np.full(n, np.inf)
+		inside = np.ones(n, np.bool_)
+		with np.errstate(divide = 'ignore', invalid = 'ignore'):
+			for p, v, c, h in ((x1, dx, x, hx), (y1, dy, y, hy)):
+				still = v == 0
+				inside &= ~still | ((c - h < p) & (p < c + h))
+				t1 = (c - h - p) / v
+				t2 = (c + h - p) / v
+				t_low = np.where(still, t_low, np.maximum(t_low, np.minimum(t1, t2)))
+				t_high = np.where(still, t_high, np.minimum(t_high, np.maximum(t1, t2)))
+		rect = inside & (t_low < t_high) & (t_low < 1) & (t_high > 0)
+
+		hit = near[np.where(self.kind[near] == CIRCLE, circle, rect)]
+		if not hit.size:
+			return None
+		return self.objects[hit[np.argmin(self.order[hit])]]
@@ -0,0 +1,247 @@
+'''
+	Parameter sweeps: runs headless games for every configuration of a grid or random search
+	over board and map parameters on all cores and prints a table of the metrics.
+
+	Parameters are addressed by dotted paths into the game parameters, e.g.
+		board.max_speed  board.max_pump  elements.0.step_size  elements.10000.obstacles.probability
+
+	python sweep.py --grid board.max_speed=20,25,30 elements.0.step_size=40,80 [--seeds 3]
+	python sweep.py --random board.max_speed=15:35 board.max_pump=3.0:6.0 --samples 40
+	options: --ticks 4000 --seed 1 --policy weave|idle|recording.json --workers 4 --output results.csv
+'''
+import argparse
+import itertools
+import json
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+
+import engine
+
+
+COLUMNS = ['distance', 'checkpoints', 'avg_speed', 'over_max', 'collisions_km', 'hits']
+
+
+def parse_key(part):
+	try:
+		return int(part)
+	except ValueError:
+		return part
+
+
+def set_path(parameters, path, value):
+	'''Sets parameters[a][b][c] = value for path 'a.b.c' (numeric parts are int keys)'''
+	keys = [parse_key(p) for p in path.split('.')]
+	d = parameters
+	for key in keys:
+		if not isinstance(d, dict) or key not in d:
+			raise KeyError('{} (no {})'.format(path, key))
+		parent, d = d, d[key]
+	parent[keys[-1]] = value
+
+
+def configure(parameters, cell):
+	'''Returns a copy of parameters with the values of cell {path: value} set'''
+	parameters = deepcopy(parameters)
+	for path, value in sorted(cell.items()):
+		set_path(parameters, path, value)
+	return parameters
+
+
+def grid_search(space):
+	'''All combinations of space {path: [values]}'''
+	paths = sorted(space)
+	return [dict(zip(paths, values)) for values in itertools.product(*[space[p] for p in paths])]
+
+
+def random_search(space, samples, seed = 0):
+	'''
+		samples random cells from space {path: (low, high) or [values]}.
+		Ranges are uniform (randrange if both bounds are int), lists are chosen from.
+	'''
+	rng = random.Random(seed)
+	paths = sorted(space)
+	cells = []
+	for _ in range(samples):
+		cell = {}
+		for path in paths:
+			values = space[path]
+			if isinstance(values, tuple):
+				low, high = values
+				if isinstance(low, int) and isinstance(high, int):
+					cell[path] = rng.randrange(low, high + 1)
+				else:
+					cell[path] = rng.uniform(low, high)
+			else:
+				cell[path] = rng.choice(values)
+		cells.append(cell)
+	return cells
+
+
+def get_policy(policy):
+	'''weave (engine.weave_policy), idle (no input) or the filename of a recorded game'''
+	if policy == 'weave':
+		return engine.weave_policy
+	if policy == 'idle':
+		return None
+	return list(engine.InputRecorder.load(policy).flags)
+
+
+def summarize(game, metrics, tick_rate = 40):
+	'''
+		The metrics of a simulated game:
+			distance       meters reached (100 pixels are a meter)
+			checkpoints    number of checkpoints passed
+			avg_speed      mean board speed (pixels per tick)
+			over_max       seconds spent faster than max_speed
+			collisions_km  hits of potholes, cars and walls per km
+			hits           {kind: ticks with a hit}
+	'''
+	ticks = len(metrics['y'])
+	distance = (metrics['y'][-1] - game.start.y) / 100.0 if ticks else 0.0
+
+	hits = {}
+	for hit in metrics['hit']:
+		if hit is not None:
+			hits[hit] = hits.get(hit, 0) + 1
+	collisions = sum(n for kind, n in hits.items() if kind != 'boost')
+
+	max_speed = game.board.max_speed
+	return {
+		'distance': distance,
+		'checkpoints': metrics['checkpoint'][-1] if ticks else 0,
+		'avg_speed': sum(metrics['speed']) / ticks if ticks else 0.0,
+		'over_max': sum(1 for s in metrics['speed'] if s > max_speed) / float(tick_rate),
+		'collisions_km': collisions / (distance / 1000.0) if distance > 0 else 0.0,
+		'hits': hits,
+		}
+
+
+def run_cell(task):
+	'''Runs one configuration for every seed (in a worker process), returns the averaged metrics'''
+	index, parameters, cell, policy, ticks, seeds = task
+	parameters = configure(parameters, cell)
+	inputs = get_policy(policy)
+
+	runs = []
+	for seed in seeds:
+		game, metrics = engine.simulate(parameters, inputs, ticks, seed = seed)
+		try:
+			runs.append(summarize(game, metrics))
+		finally:
+			# Stops the spawn thread (general parameter spawn_thread)
+			game.close()
+
+	result = {'index': index, 'cell': cell, 'seeds': seeds, 'runs': runs}
+	for column in COLUMNS[:-1]:
+		result[column] = sum(r[column] for r in runs) / len(runs)
+
+	hits = {}
+	for r in runs:
+		for kind, n in r['hits'].items():
+			hits[kind] = hits.get(kind, 0) + float(n) / len(runs)
+	result['hits'] = hits
+	return result
+
+
+def sweep(cells, parameters = None, policy = 'weave', ticks = 4000, seeds = 1, seed = 1, workers = None):
+	'''
+		Runs all cells ({path: value} dicts) in a ProcessPoolExecutor.
+		Every cell is run with the same seeds (seed, seed + 1, ...), so the cells
+		are compared on the same obstacles and each one is reproducible on its own.
+		Returns the results in the order of cells.
+	'''
+	if parameters is None:
+		parameters = engine.example_parameters
+
+	seeds = [seed + i for i in range(seeds)]
+	tasks = [(i, parameters, cell, policy, ticks, seeds) for i, cell in enumerate(cells)]
+
+	with ProcessPoolExecutor(max_workers = workers) as executor:
+		return list(executor.map(run_cell, tasks))
+
+
+def parse_value(text):
+	try:
+		return json.loads(text)
+	except ValueError:
+		return text
+
+
+def parse_space(items, ranges = False):
+	'''
+		path=v1,v2,v3 is a list of values.
+		path=low:high is a range (only for random search).
+	'''
+	space = {}
+	for item in items:
+		path, values = item.split('=', 1)
+		if ranges and ':' in values:
+			low, high = values.split(':')
+			space[path] = (parse_value(low), parse_value(high))
+		else:
+			space[path] = [parse_value(v) for v in values.split(',')]
+	return space
+
+
+def table(results):
+	paths = sorted(set(p for r in results for p in r['cell']))
+	header = paths + COLUMNS
+	rows = [header]
+	for r in results:
+		hits = ' '.join('{}:{:g}'.format(k, v) for k, v in sorted(r['hits'].items()))
+		cell = ['{:g}'.format(v) if isinstance(v, float) else v for v in [r['cell'][p] for p in paths]]
+		rows.append(cell + ['{:.1f}'.format(r['distance']), '{:g}'.format(r['checkpoints']), '{:.2f}'.format(r['avg_speed']),
+			'{:.2f}'.format(r['over_max']), '{:.2f}'.format(r['collisions_km']), hits])
+	return rows
+
+
+def write(results, filename):
+	if filename.endswith('.json'):
+		with open(filename, 'w') as f:
+			json.dump(results, f, indent = 2, sort_keys = True)
+	else:
+		with open(filename, 'w') as f:
+			for row in table(results):
+				f.write(','.join(str(v) for v in row) + '\n')
+
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = 'SlalomBoard parameter sweeps')
+	search = parser.add_mutually_exclusive_group(required = True)
+	search.add_argument('--grid', nargs = '+', metavar = 'PATH=V1,V2', help = 'grid search over all combinations')
+	search.add_argument('--random', nargs = '+', metavar = 'PATH=LOW:HIGH', help = 'random search (ranges or value lists)')
+	parser.add_argument('--samples', type = int, default = 20, help = 'cells of the random search')
+	parser.add_argument('--ticks', type = int, default = 4000)
+	parser.add_argument('--seeds', type = int, default = 1, help = 'games per cell')
+	parser.add_argument('--seed', type = int, default = 1, help = 'first game seed (and seed of the random search)')
+	parser.add_argument('--policy', default = 'weave', help = 'weave, idle or a recorded game (json)')
+	parser.add_argument('--workers', type = int, default = None, help = 'processes (default: all cores)')
+	parser.add_argument('--output', '-o', help = 'write the results to a csv or json file')
+	args = parser.parse_args(argv)
+
+	if args.grid:
+		cells = grid_search(parse_space(args.grid))
+	else:
+		cells = random_search(parse_space(args.random, True), args.samples, args.seed)
+
+	# Fail on wrong paths before starting the workers
+	for cell in cells:
+		configure(engine.example_parameters, cell)
+
+	results = sweep(cells, policy = args.policy, ticks = args.ticks, seeds = args.seeds,
+		seed = args.seed, workers = args.workers)
+
+	rows = table(results)
+	widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+	for row in rows:
+		print('  '.join(str(v).ljust(w) for v, w in zip(row, widths)))
+
+	if args.output:
+		write(results, args.output)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,32 @@
+import numpy as np
+
+import batch
+from engine import LEFT, RIGHT, PUMP, BRAKE
+
+
+def test_compare():
+	assert batch.compare(n = 20, ticks = 1000) == 0
+
+
+def test_compare_jitter():
+	# Boards over their max_speed jitter the lean
+	assert batch.compare(n = 20, ticks = 1000, seed = 2, max_speed = (1, 3)) == 0
+
+
+def test_compare_masks():
+	# Brake and pump together and with the leans, so the masks select different boards
+	choices = (0, BRAKE, PUMP, PUMP | BRAKE, LEFT | BRAKE, RIGHT | PUMP | BRAKE, LEFT | PUMP)
+	assert batch.compare(n = 20, ticks = 1000, seed = 3, choices = choices) == 0
+
+
+def test_standing_boards():
+	# Pumping or braking a board without speed must not spread nan or inf
+	from geometry import Point
+	boards = [dict(max_lean = 0.02, lean_vel = 0.001, max_speed = 20, jitter = 0.01, break_speed = 1, slowed = 0.05,
+		break_effect = 1.5, max_pump = 4, optimal_velocity = 10, sigma = 10) for _ in range(3)]
+	b = batch.BoardBatch(boards, Point(375, 81.25), Point(0, 5))
+	b.dx[1] = b.dy[1] = 0.0
+	b.player[:] = 0.01
+	b.apply_input([PUMP | BRAKE, PUMP | BRAKE, PUMP])
+	assert np.isfinite(b.dx).all() and np.isfinite(b.dy).all()
+	assert b.dx[1] == 0 and b.dy[1] == 0
@@ -0,0 +1,42 @@
+from copy import deepcopy
+
+import pytest
+
+import engine
+from engine import CircularObstacle
+from geometry import Point
+
+
+def make_game(store):
+	parameters = deepcopy(engine.example_parameters)
+	parameters['general']['obstacle_store'] = store
+	return engine.Game(engine.setup_parameters(parameters), engine.headers, seed = 1)
+
+
+def add_pothole(game, x, y, radius = 3):
+	game.clear_obstacles()
+	name = sorted(engine.headers['potholes'])[0]
+	image = engine.headers['potholes'][name]
+	return game.spawn(CircularObstacle, Point(x, y), 0, radius, image, 50, ('potholes', name))
+
+
+@pytest.mark.parametrize('store', ['grid', 'array'])
+def test_fast_board_hits_small_pothole(store):
+	# The board moved 24 along the street during the tick, the pothole is anywhere on the way
+	game = make_game(store)
+	point = Point(400.0, game.start.y)
+	game.sweep.set(0.0, 24.0)
+	for offset in range(24):
+		pothole = add_pothole(game, point.x, point.y - offset)
+		assert game.obstacle_at(point) is pothole, offset
+
+
+@pytest.mark.parametrize('store', ['grid', 'array'])
+def test_zero_length_segment_is_point_test(store):
+	game = make_game(store)
+	point = Point(400.0, game.start.y)
+	game.sweep.set(0.0, 0.0)
+	for dx, dy in [(0, 0), (2, 0), (0, -2.9), (2, 2), (3, 0), (0, 3.1), (-4, 0), (2.2, -2.2), (10, 10)]:
+		pothole = add_pothole(game, point.x + dx, point.y + dy)
+		expected = pothole if pothole.check_collision(point) else None
+		assert game.obstacle_at(point) is expected, (dx, dy)
@@ -0,0 +1,25 @@
+from copy import deepcopy
+
+import pytest
+
+import engine
+
+
+@pytest.mark.parametrize('store', ['grid', 'array'])
+@pytest.mark.parametrize('spawn_thread', [False, True])
+def test_replay_saved_inputs(tmp_path, store, spawn_thread):
+	parameters = deepcopy(engine.example_parameters)
+	parameters['general']['obstacle_store'] = store
+	parameters['general']['spawn_thread'] = spawn_thread
+
+	game, metrics = engine.simulate(parameters, engine.weave_policy, 1500, seed = 7)
+	game.close()
+	filename = str(tmp_path / 'inputs.json')
+	game.recorder.save(filename)
+
+	recorder = engine.InputRecorder.load(filename)
+	replayed, replay_metrics = engine.replay(recorder)
+	replayed.close()
+
+	assert replay_metrics == metrics
+	assert any(hit is not None for hit in metrics['hit'])
@@ -0,0 +1,68 @@
+from bisect import bisect_left
+from copy import deepcopy
+
+
+class MapTimeline(object):
+	def __init__(self, elements):
+		'''
+			The elements of a map ({distance: element parameters}) sorted by distance.
+			The elements are copied once and never changed, so a timeline can be shared
+			by any number of games. The element at index i is in effect from distances[i]
+			(exclusive) until the next one, the first one from the start.
+		'''
+		distances = sorted(elements)
+		self.distances = tuple(distances)
+		self.elements = tuple(deepcopy(elements[d]) for d in distances)
+
+	@classmethod
+	def compile(cls, elements):
+		'''Returns elements if it already is a timeline, a new timeline otherwise'''
+		if isinstance(elements, cls):
+			return elements
+		return cls(elements)
+
+	def __len__(self):
+		return len(self.elements)
+
+	def __getitem__(self, index):
+		return self.elements[index]
+
+	def distance(self, index):
+		'''The distance where element index starts, None after the last one'''
+		if index < len(self.distances):
+			return self.distances[index]
+		return None
+
+	def index_at(self, distance):
+		'''The index of the element in effect at distance'''
+		return max(bisect_left(self.distances, distance) - 1, 0)
+
+	def element_at(self, distance):
+		return self.elements[self.index_at(distance)]
+
+
+class TimelineCursor(object):
+	def __init__(self, timeline, distance = None):
+		'''
+			The current element of a timeline, advanced as the distance grows.
+			Starts at the first element or at the one in effect at distance.
+		'''
+		self.timeline = timeline
+		self.seek(distance)
+
+	def seek(self, distance = None):
+		self.index = 0 if distance is None else self.timeline.index_at(distance)
+		self.next_distance = self.timeline.distance(self.index + 1)
+
+	@property
+	def element(self):
+		return self.timeline[self.index]
+
+	def advance(self, distance):
+		'''Moves to the next element if distance is past its start, returns it (None if not)'''
+		if self.next_distance is None or distance <= self.next_distance:
+			return None
+
+		self.index += 1
+		self.next_distance = self.timeline.distance(self.index + 1)
+		return self.timeline[self.index]